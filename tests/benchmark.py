@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+"""
+Benchmarks resolving, reversing and switching languages with a generated
+URLconf, and prints the results as JSON.
+
+The URLconf has ``--patterns`` URL patterns spread over ``--depth`` levels of
+included URLconfs, all inside ``lang_prefixed_patterns``. Every pattern is
+translated into each of the ``--languages`` languages by gettext catalogs
+written along with the URLconf into a temporary directory.
+
+Usage:
+
+    python benchmark.py --patterns=500 --languages=4 --depth=3 --output=results.json
+
+"""
+import array
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+path, scriptname = os.path.split(__file__)
+sys.path.append(os.path.abspath(os.path.join(path, '..')))
+
+
+URLCONF_PACKAGE = 'bench_urls'
+
+
+def get_languages(count):
+    return ['l%d' % i for i in range(count)]
+
+
+def translate(text, lang_index):
+    """
+    Returns the translation of a regex or path segment into the language at
+    ``lang_index``. The first language is the one the patterns are written
+    in.
+    """
+    if lang_index == 0:
+        return text
+    return text.replace('-', '-l%d-' % lang_index, 1)
+
+
+def get_levels(pattern_count, depth):
+    """
+    Returns the indexes of the patterns at each level of the URLconf.
+    """
+    per_level = max(pattern_count / depth, 1)
+    levels = []
+    for level in range(depth):
+        start = level * per_level
+        if level == depth - 1:
+            end = pattern_count
+        else:
+            end = min(start + per_level, pattern_count)
+        levels.append(range(start, end))
+    return levels
+
+
+def write_file(file_path, content):
+    f = open(file_path, 'w')
+    try:
+        f.write(content)
+    finally:
+        f.close()
+
+
+def write_urlconf(directory, levels):
+    package_dir = os.path.join(directory, URLCONF_PACKAGE)
+    os.mkdir(package_dir)
+    write_file(os.path.join(package_dir, '__init__.py'), '')
+
+    views = ['from django.http import HttpResponse\n']
+    for index in range(sum([len(level) for level in levels])):
+        views.append('def view_%d(request, id):\n    return HttpResponse("")\n' % index)
+    write_file(os.path.join(package_dir, 'views.py'), '\n'.join(views))
+
+    write_file(os.path.join(package_dir, 'root.py'),
+        'from transurlvania.defaults import *\n\n'
+        'urlpatterns = lang_prefixed_patterns("",\n'
+        '    url(r"^level-0/", include("%s.level0")),\n'
+        ')\n' % URLCONF_PACKAGE)
+
+    for level, indexes in enumerate(levels):
+        lines = [
+            'from transurlvania.defaults import *\n',
+            'urlpatterns = patterns("%s.views",' % URLCONF_PACKAGE,
+        ]
+        for index in indexes:
+            lines.append('    url(r"^item-%d/(?P<id>\\d+)/$", "view_%d", name="view-%d"),'
+                         % (index, index, index))
+        if level + 1 < len(levels):
+            lines.append('    url(r"^level-%d/", include("%s.level%d")),'
+                         % (level + 1, URLCONF_PACKAGE, level + 1))
+        lines.append(')\n')
+        write_file(os.path.join(package_dir, 'level%d.py' % level), '\n'.join(lines))
+
+
+def get_regexes(levels):
+    regexes = []
+    for level, indexes in enumerate(levels):
+        regexes.append(r'^level-%d/' % level)
+        for index in indexes:
+            regexes.append(r'^item-%d/(?P<id>\d+)/$' % index)
+    return regexes
+
+
+def quote_po(text):
+    return '"%s"' % text.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def write_mo(file_path, messages):
+    # The same layout as written by Python's Tools/i18n/msgfmt.py.
+    keys = sorted(messages.keys())
+    ids = strs = ''
+    offsets = []
+    for key in keys:
+        offsets.append((len(ids), len(key), len(strs), len(messages[key])))
+        ids += key + '\0'
+        strs += messages[key] + '\0'
+    key_start = 7 * 4 + 16 * len(keys)
+    value_start = key_start + len(ids)
+    key_offsets = []
+    value_offsets = []
+    for id_offset, id_length, str_offset, str_length in offsets:
+        key_offsets += [id_length, id_offset + key_start]
+        value_offsets += [str_length, str_offset + value_start]
+    output = struct.pack('Iiiiiii', 0x950412deL, 0, len(keys), 7 * 4,
+                         7 * 4 + len(keys) * 8, 0, 0)
+    output += array.array('i', key_offsets).tostring()
+    output += array.array('i', value_offsets).tostring()
+    output += ids + strs
+    f = open(file_path, 'wb')
+    try:
+        f.write(output)
+    finally:
+        f.close()
+
+
+def write_catalogs(directory, languages, regexes):
+    for lang_index, lang in enumerate(languages):
+        if lang_index == 0:
+            continue
+        messages_dir = os.path.join(directory, 'locale', lang, 'LC_MESSAGES')
+        os.makedirs(messages_dir)
+        messages = {'': 'Content-Type: text/plain; charset=UTF-8\n'}
+        po = ['msgid ""', 'msgstr ""', '"Content-Type: text/plain; charset=UTF-8\\n"', '']
+        for regex in regexes:
+            messages[regex] = translate(regex, lang_index)
+            po.extend(['msgid %s' % quote_po(regex),
+                       'msgstr %s' % quote_po(messages[regex]), ''])
+        write_file(os.path.join(messages_dir, 'django.po'), '\n'.join(po))
+        write_mo(os.path.join(messages_dir, 'django.mo'), messages)
+
+
+def configure(directory, languages, engine):
+    from django.conf import settings
+    settings.configure(
+        DEBUG=False,
+        USE_I18N=True,
+        LANGUAGE_CODE=languages[0],
+        LANGUAGES=[(lang, lang) for lang in languages],
+        LOCALE_PATHS=(os.path.join(directory, 'locale'),),
+        ROOT_URLCONF='%s.root' % URLCONF_PACKAGE,
+        INSTALLED_APPS=('transurlvania',),
+        MULTILANG_RESOLVE_ENGINE=engine,
+    )
+
+
+def get_path(lang_index, lang, level, index):
+    segments = [translate('level-%d/' % i, lang_index) for i in range(level + 1)]
+    return '/%s/%s%s1/' % (lang, ''.join(segments), translate('item-%d/' % index, lang_index))
+
+
+def get_samples(languages, levels, count):
+    """
+    Returns ``(lang, path, view name)`` triples for ``count`` patterns spread
+    evenly through the URLconf, in each language.
+    """
+    patterns = []
+    for level, indexes in enumerate(levels):
+        for index in indexes:
+            patterns.append((level, index))
+    step = max(len(patterns) / count, 1)
+    samples = []
+    for lang_index, lang in enumerate(languages):
+        for level, index in patterns[::step][:count]:
+            samples.append((lang, get_path(lang_index, lang, level, index), 'view-%d' % index))
+    return samples
+
+
+def reload_urlconf():
+    """
+    Forgets the URLconf and everything built from it, so the next resolve or
+    reverse starts from scratch.
+    """
+    from django.core import urlresolvers as django_urlresolvers
+    from transurlvania import urlresolvers
+    for name in sys.modules.keys():
+        if name.startswith('%s.level' % URLCONF_PACKAGE) or name == '%s.root' % URLCONF_PACKAGE:
+            del sys.modules[name]
+    urlresolvers.clear_resolver_cache()
+    urlresolvers._normalized_regexes.clear()
+    urlresolvers._candidate_regexes.clear()
+    django_urlresolvers.clear_url_caches()
+
+
+def timed(func, operations):
+    start = time.time()
+    func()
+    seconds = time.time() - start
+    result = {'operations': operations, 'seconds': seconds}
+    if seconds:
+        result['per_second'] = operations / seconds
+    return result
+
+
+def run(languages, levels, options):
+    from django.core.urlresolvers import resolve
+    from django.http import HttpRequest, HttpResponse
+    from django.template import Context, Template
+    from django.utils import translation
+
+    from transurlvania import urlresolvers
+    from transurlvania.middleware import LangInPathMiddleware, URLTransMiddleware
+    from transurlvania.translators import AutodetectScheme, LazyURLTranslator
+
+    samples = get_samples(languages, levels, options.samples)
+    iterations = options.iterations
+    results = {}
+
+    def resolve_samples():
+        for lang, path, name in samples:
+            translation.activate(lang)
+            resolve(path)
+        translation.deactivate()
+
+    reload_urlconf()
+    results['resolve (cold)'] = timed(resolve_samples, len(samples))
+
+    def resolve_warm():
+        for i in xrange(iterations):
+            resolve_samples()
+    results['resolve (warm)'] = timed(resolve_warm, len(samples) * iterations)
+
+    def reverse_samples():
+        for i in xrange(iterations):
+            for lang, path, name in samples:
+                urlresolvers.reverse_for_language(name, lang, kwargs={'id': 1})
+    results['reverse_for_language'] = timed(reverse_samples, len(samples) * iterations)
+
+    root_urlconf = '%s.root' % URLCONF_PACKAGE
+    def build_reverse_dicts():
+        for lang in languages:
+            resolver = urlresolvers.MultilangRegexURLResolver(r'^/', root_urlconf)
+            resolver._build_reverse_dict_for_lang(lang)
+    reload_urlconf()
+    urlresolvers.compile_all_languages(root_urlconf, languages)
+    results['_build_reverse_dict_for_lang'] = timed(build_reverse_dicts, len(languages))
+
+    def build_all_reverse_dicts():
+        resolver = urlresolvers.MultilangRegexURLResolver(r'^/', root_urlconf)
+        resolver.build_reverse_dicts(languages)
+    reload_urlconf()
+    urlresolvers.compile_all_languages(root_urlconf, languages)
+    results['build_reverse_dicts'] = timed(build_all_reverse_dicts, len(languages))
+
+    def make_request(path):
+        request = HttpRequest()
+        request.path = request.path_info = path
+        request.META = {'SERVER_NAME': 'testserver', 'SERVER_PORT': '80'}
+        return request
+
+    middleware = [LangInPathMiddleware(), URLTransMiddleware()]
+    request_methods = [m.process_request for m in middleware if hasattr(m, 'process_request')]
+    view_methods = [m.process_view for m in middleware if hasattr(m, 'process_view')]
+    response_methods = [m.process_response for m in middleware if hasattr(m, 'process_response')]
+    response_methods.reverse()
+    # The resolving and the requests are done beforehand, so that only the
+    # middleware is timed.
+    resolved = []
+    for lang, path, name in samples:
+        translation.activate(lang)
+        resolved.append((path, resolve(path)))
+    translation.deactivate()
+    requests = [(make_request(path), match) for i in xrange(iterations)
+                for path, match in resolved]
+    response = HttpResponse('')
+    def run_middleware():
+        for request, (view_func, view_args, view_kwargs) in requests:
+            for method in request_methods:
+                method(request)
+            for method in view_methods:
+                method(request, view_func, view_args, view_kwargs)
+            for method in response_methods:
+                method(request, response)
+        translation.deactivate()
+    results['middleware'] = timed(run_middleware, len(requests))
+
+    template = Template('{%% load transurlvania_tags %%}{%% this_page_in_lang "%s" %%}'
+                        % languages[-1])
+    scheme = AutodetectScheme()
+    def render_switcher():
+        for i in xrange(iterations):
+            for lang, path, name in samples:
+                translation.activate(lang)
+                # The translator only holds the request weakly.
+                request = make_request(path)
+                translator = LazyURLTranslator(request)
+                translator.set_view_info(*resolve(path))
+                translator.scheme = scheme
+                template.render(Context({'_url_translator': translator}))
+        translation.deactivate()
+    results['this_page_in_lang'] = timed(render_switcher, len(samples) * iterations)
+
+    return results
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--patterns', type='int', default=200,
+        help='Number of URL patterns in the URLconf.')
+    parser.add_option('--languages', type='int', default=3,
+        help='Number of languages the patterns are translated into.')
+    parser.add_option('--depth', type='int', default=2,
+        help='Number of levels of included URLconfs.')
+    parser.add_option('--samples', type='int', default=20,
+        help='Number of patterns resolved and reversed in each language.')
+    parser.add_option('--iterations', type='int', default=100,
+        help='Number of times the samples are run for the warm benchmarks.')
+    parser.add_option('--engine', default='sequential',
+        help='Value of MULTILANG_RESOLVE_ENGINE.')
+    parser.add_option('--output', default=None,
+        help='File to write the JSON results to, instead of standard output.')
+    options, args = parser.parse_args()
+
+    languages = get_languages(options.languages)
+    levels = get_levels(options.patterns, options.depth)
+    directory = tempfile.mkdtemp()
+    try:
+        write_urlconf(directory, levels)
+        write_catalogs(directory, languages, get_regexes(levels))
+        sys.path.insert(0, directory)
+        configure(directory, languages, options.engine)
+        results = run(languages, levels, options)
+    finally:
+        shutil.rmtree(directory)
+
+    import django
+    from django.utils import simplejson
+    report = simplejson.dumps({
+        'config': {
+            'patterns': options.patterns,
+            'languages': options.languages,
+            'depth': options.depth,
+            'samples': options.samples,
+            'iterations': options.iterations,
+            'engine': options.engine,
+        },
+        'python': sys.version.split()[0],
+        'django': django.get_version(),
+        'results': results,
+    }, indent=2, sort_keys=True)
+    if options.output:
+        write_file(options.output, report + '\n')
+    else:
+        print report
+
+
+if __name__ == '__main__':
+    main()
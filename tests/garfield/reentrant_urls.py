@@ -0,0 +1,7 @@
+from transurlvania.defaults import *
+
+
+urlpatterns = patterns('garfield.reentrant_views',
+    url(r'^first/$', 'first', name='reentrant_first'),
+    url(r'^other/$', 'other', name='reentrant_other'),
+)
@@ -0,0 +1,18 @@
+"""
+Views that reverse a URL from their own URLconf as they're imported, which
+happens while the URLconf's resolver is being built.
+"""
+from django.http import HttpResponse
+
+from transurlvania.urlresolvers import reverse_for_language
+
+
+OTHER_URL = reverse_for_language('reentrant_other', 'en', 'garfield.reentrant_urls')
+
+
+def first(request):
+    return HttpResponse(OTHER_URL)
+
+
+def other(request):
+    return HttpResponse('')
@@ -1,22 +1,46 @@
 #encoding=utf-8
+import gc
+import marshal
+import os
 import re
+import tempfile
+import threading
+import time
+import weakref
 
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.core.exceptions import ImproperlyConfigured
+from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist
+from django.core.exceptions import ViewDoesNotExist
 from django.core.urlresolvers import get_resolver, reverse, clear_url_caches
-from django.core.urlresolvers import NoReverseMatch
+from django.core.urlresolvers import NoReverseMatch, Resolver404
+from django.http import HttpRequest, HttpResponse
+from django.core import urlresolvers as django_resolvers
 from django.template import Context, Template, TemplateSyntaxError
 from django.test import TestCase, Client
 from django.utils import translation, http
 
+import transurlvania.middleware
 import transurlvania.settings
 from transurlvania import urlresolvers as transurlvania_resolvers
-from transurlvania.translators import NoTranslationError
-from transurlvania.urlresolvers import reverse_for_language
-from transurlvania.utils import complete_url
+from transurlvania.indexes import literal_prefix, PrefixIndex
+from transurlvania.indexes import make_groups_non_capturing, AlternationIndex
+from transurlvania.indexes import has_top_level_alternation
+from transurlvania.indexes import RESOLVE_INDEXES
+from transurlvania import instrumentation
+from transurlvania.lru import LRUCache
+from transurlvania import routing_table
+from transurlvania import sitemaps
+from transurlvania.translators import NoTranslationError, URLTranslator
+from transurlvania.translators import AutodetectScheme, BasicScheme
+from transurlvania.translators import ObjectBasedScheme, ViewInfo
+from transurlvania.decorators import permalink_in_lang
+from transurlvania.urlresolvers import reverse_for_language, reverse_many
+from transurlvania.utils import complete_url, get_absolute_urls
 from transurlvania.views import detect_language_and_redirect
+from transurlvania.warmup import warm_up, preload
 
+from garfield.models import ComicStrip
 from garfield.views import home, about_us, the_president
 from garfield.views import comic_strip_list, comic_strip_detail, landing
 from garfield.views import jim_davis
@@ -85,6 +109,1085 @@ class TransURLTestCase(TestCase):
             self.fail("Reverse lookup failed: %s" % e)
 
 
+class ResolverCacheTestCase(TestCase):
+    """
+    Test the language-keyed resolver cache that replaces Django's.
+    """
+    def setUp(self):
+        translation.activate('en')
+
+    def tearDown(self):
+        translation.deactivate()
+
+    def testGetResolverIsLanguageKeyed(self):
+        en_resolver = django_resolvers.get_resolver(None)
+        self.assertTrue(en_resolver is django_resolvers.get_resolver(None))
+        translation.activate('fr')
+        fr_resolver = django_resolvers.get_resolver(None)
+        self.assertTrue(fr_resolver is not en_resolver)
+        self.assertTrue(fr_resolver is transurlvania_resolvers.get_resolver(None, 'fr'))
+
+    def testReverseSwitchesLanguageWithoutClearingCaches(self):
+        self.assertEqual(reverse(the_president), '/en/garfield/the-president/')
+        translation.activate('fr')
+        self.assertEqual(reverse(the_president), http.urlquote(u'/fr/garfield/le-président/'))
+        translation.activate('en')
+        self.assertEqual(reverse(the_president), '/en/garfield/the-president/')
+
+    def testNamespaceDictIsPerLanguage(self):
+        resolver = transurlvania_resolvers.get_resolver(None, 'en')
+        self.assertEqual(resolver.get_namespace_dict('en')['admin'][0], 'en/admin/')
+        self.assertEqual(resolver.get_namespace_dict('fr')['admin'][0], 'fr/admin/')
+
+
+class CountingResolverRegistry(transurlvania_resolvers.ResolverRegistry):
+    builds = 0
+
+    def build(self, urlconf, lang):
+        self.builds += 1
+        time.sleep(0.05)
+        return super(CountingResolverRegistry, self).build(urlconf, lang)
+
+
+class ResolverRegistryTestCase(TestCase):
+    """
+    Test the registry of root resolvers.
+    """
+    def testSingleFlight(self):
+        registry = CountingResolverRegistry()
+        resolvers = []
+        def get_resolver():
+            resolvers.append(registry.get('tests.urls', 'fr'))
+        threads = [threading.Thread(target=get_resolver) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(registry.builds, 1)
+        self.assertEqual(len(resolvers), 5)
+        for resolver in resolvers:
+            self.assertTrue(resolver is resolvers[0])
+
+    def testReentrantBuild(self):
+        # garfield.reentrant_views reverses a URL while it's being imported
+        # to build the resolver, which should fail rather than deadlock.
+        errors = []
+        def get_resolver():
+            try:
+                transurlvania_resolvers.get_resolver('garfield.reentrant_urls', 'en')
+            except ViewDoesNotExist, e:
+                errors.append(e)
+        thread = threading.Thread(target=get_resolver)
+        thread.setDaemon(True)
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.isAlive())
+        self.assertEqual(len(errors), 1)
+        self.assertFalse(('garfield.reentrant_urls', 'en')
+                         in transurlvania_resolvers.resolver_registry)
+
+    def testWarmAndIntrospection(self):
+        registry = transurlvania_resolvers.ResolverRegistry()
+        registry.warm('tests.urls', ['en', 'fr'])
+        self.assertEqual(sorted(registry.keys()),
+                         [('tests.urls', 'en'), ('tests.urls', 'fr')])
+        self.assertTrue(('tests.urls', 'fr') in registry)
+        self.assertFalse(('tests.urls', 'de') in registry)
+        registry.clear()
+        self.assertEqual(len(registry), 0)
+
+    def testBounded(self):
+        registry = transurlvania_resolvers.ResolverRegistry(maxsize=2)
+        registry.warm('tests.urls', ['en', 'fr', 'de'])
+        self.assertEqual(registry.keys(), [('tests.urls', 'fr'), ('tests.urls', 'de')])
+
+
+class WarmUpTestCase(TestCase):
+    """
+    Test loading everything needed for translated URLs ahead of time.
+    """
+    def setUp(self):
+        self.old_engine = transurlvania.settings.RESOLVE_ENGINE
+        transurlvania.settings.RESOLVE_ENGINE = 'prefix'
+
+    def tearDown(self):
+        transurlvania.settings.RESOLVE_ENGINE = self.old_engine
+
+    def testWarmUp(self):
+        timings = warm_up('tests.urls', ['en', 'fr'])
+        self.assertEqual([stage for (stage, seconds) in timings],
+            ['catalogs', 'resolvers', 'regexes', 'reverse dicts', 'resolve indexes'])
+        self.assertTrue(('tests.urls', 'fr') in transurlvania_resolvers.resolver_registry)
+        lang_resolver = transurlvania_resolvers.get_resolver('tests.urls', 'fr').url_patterns[0]
+        self.assertTrue('fr' in lang_resolver._lang_reverse_dicts)
+        self.assertTrue(isinstance(lang_resolver._lang_resolve_indexes[('prefix', 'fr')], PrefixIndex))
+
+    def testCommand(self):
+        from transurlvania.management.commands.warmurls import Command
+        output = Command().handle_noargs(urlconf='tests.urls', languages='en,fr')
+        stages = [line.split(':')[0] for line in output.split('\n')]
+        self.assertEqual(stages, ['catalogs', 'resolvers', 'regexes', 'reverse dicts',
+                                  'resolve indexes', 'total'])
+
+
+def forget_url_patterns(urlconf):
+    """
+    Clears everything the URLconf's patterns and the resolvers built from
+    them have filled in for each language.
+    """
+    for pattern in routing_table.get_url_patterns(urlconf):
+        for name in ('_regex_dict', '_lang_reverse_dicts', '_lang_reverse_indexes',
+                     '_lang_namespace_dicts', '_lang_app_dicts', '_lang_resolve_indexes'):
+            if hasattr(pattern, name):
+                getattr(pattern, name).clear()
+        if hasattr(pattern, '_regexes'):
+            pattern._regexes = (None,) * len(pattern._regexes)
+            pattern._other_regexes = None
+    transurlvania_resolvers.clear_resolver_cache()
+
+
+class PreloadTestCase(TestCase):
+    """
+    Test that preloaded resolvers aren't added to while serving requests.
+    """
+    def setUp(self):
+        self.old_engine = transurlvania.settings.RESOLVE_ENGINE
+        transurlvania.settings.RESOLVE_ENGINE = 'prefix'
+        forget_url_patterns('tests.urls')
+
+    def tearDown(self):
+        transurlvania.settings.RESOLVE_ENGINE = self.old_engine
+        translation.deactivate()
+
+    def get_sizes(self):
+        sizes = []
+        resolvers = [transurlvania_resolvers.get_resolver(None, lang) for lang in ('en', 'fr')]
+        for resolver in resolvers:
+            for pattern in [resolver] + list(transurlvania_resolvers.iter_url_patterns(resolver.url_patterns)):
+                for name in ('_regex_dict', '_lang_reverse_dicts', '_lang_resolve_indexes'):
+                    sizes.append(len(getattr(pattern, name, ())))
+                for indexes in getattr(pattern, '_lang_reverse_indexes', {}).values():
+                    sizes.append(len(indexes))
+        return sizes
+
+    def testNothingAddedAfterPreload(self):
+        timings = preload(None, ['en', 'fr'])
+        self.assertEqual(timings[-1][0], 'preload')
+        sizes = self.get_sizes()
+        translation.activate('fr')
+        resolver = transurlvania_resolvers.get_resolver(None, 'fr')
+        self.assertEqual(resolver.resolve(u'/fr/garfield/le-président/')[0], the_president)
+        reverse_for_language(about_us, 'fr')
+        reverse_for_language('admin:garfield_comicstrip_change', 'en', args=[1])
+        self.assertRaises(NoReverseMatch, reverse_for_language, 'no-such-view', 'fr')
+        self.assertEqual(self.get_sizes(), sizes)
+
+
+class CatalogHandleTestCase(TestCase):
+    """
+    Test the cache of gettext catalog handles used to translate URL patterns.
+    """
+    def tearDown(self):
+        transurlvania_resolvers.reload_catalogs()
+
+    def testHandlesAreCached(self):
+        ugettext = transurlvania_resolvers.get_ugettext('fr')
+        self.assertEqual(ugettext(u'^about-us/$'), u'^a-propos-de-nous/$')
+        self.assertTrue(transurlvania_resolvers.get_ugettext('fr') is ugettext)
+        self.assertEqual(transurlvania_resolvers.translate_regex(r'^about-us/$', 'fr'),
+                         u'^a-propos-de-nous/$')
+
+    def testReload(self):
+        transurlvania_resolvers.get_ugettext('fr')
+        transurlvania_resolvers.reload_catalogs()
+        self.assertFalse('fr' in transurlvania_resolvers._ugettext_handles)
+
+    def testReloadForgetsTransInLangStrings(self):
+        from transurlvania.templatetags import transurlvania_tags
+        self.assertEqual(transurlvania_tags.trans_in_lang('French', 'fr'), u'Français')
+        transurlvania_tags._translations[('fr', 'French')] = u'Stale'
+        self.assertEqual(transurlvania_tags.trans_in_lang('French', 'fr'), u'Stale')
+        transurlvania_resolvers.reload_catalogs()
+        self.assertEqual(transurlvania_tags._translations, {})
+        self.assertEqual(transurlvania_tags._language_checks, None)
+        self.assertEqual(transurlvania_tags.trans_in_lang('French', 'fr'), u'Français')
+
+
+class PrecompiledRegexTestCase(TestCase):
+    """
+    Test the eager compilation of translated URL regexes.
+    """
+    def testCompileAllLanguages(self):
+        transurlvania_resolvers.compile_all_languages('tests.urls')
+        table = transurlvania_resolvers.get_regex_table('tests.urls')
+        regexes = {}
+        for pattern, regex_dict in table:
+            if getattr(pattern, '_raw_regex', None) == r'^about-us/$':
+                regexes = regex_dict
+        self.assertEqual(set(regexes.keys()), set(['en', 'fr', 'de']))
+        self.assertEqual(regexes['en'].pattern, r'^about-us/$')
+        self.assertEqual(regexes['fr'].pattern, r'^a-propos-de-nous/$')
+
+    def testPrecompiledOnHandlerResolve(self):
+        forget_url_patterns('tests.urls')
+        transurlvania_resolvers._compiled_urlconfs.clear()
+        old_precompile = transurlvania.settings.PRECOMPILE_URLS
+        transurlvania.settings.PRECOMPILE_URLS = True
+        translation.activate('fr')
+        try:
+            # Resolve the way Django's request handler does, with a resolver
+            # of its own rather than one from the resolver registry.
+            resolver = django_resolvers.RegexURLResolver(r'^/', 'tests.urls')
+            self.assertEqual(resolver.resolve('/fr/a-propos-de-nous/')[0], about_us)
+        finally:
+            transurlvania.settings.PRECOMPILE_URLS = old_precompile
+            translation.deactivate()
+        self.assertEqual(len(transurlvania_resolvers.resolver_registry), 0)
+        for pattern, regex_dict in transurlvania_resolvers.get_regex_table('tests.urls'):
+            self.assertEqual(set(regex_dict.keys()), set(['en', 'fr', 'de']))
+
+
+class RoutingTableTestCase(TestCase):
+    """
+    Test writing and loading the offline-compiled routing table.
+    """
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.old_domains = transurlvania.settings.LANGUAGE_DOMAINS
+        transurlvania.settings.LANGUAGE_DOMAINS = {}
+
+    def tearDown(self):
+        transurlvania.settings.LANGUAGE_DOMAINS = self.old_domains
+        os.remove(self.path)
+        routing_table._root_entries.clear()
+        transurlvania_resolvers.clear_resolver_cache()
+
+    def testLoad(self):
+        routing_table.write_routing_table(self.path, 'tests.urls', ['en', 'fr'])
+        forget_url_patterns('tests.urls')
+        self.assertTrue(routing_table.load_routing_table(self.path, 'tests.urls'))
+        for pattern in routing_table.get_url_patterns('tests.urls'):
+            if getattr(pattern, '_raw_regex', None) == r'^about-us/$':
+                self.assertEqual(pattern._regex_dict['fr'].pattern, r'^a-propos-de-nous/$')
+                self.assertFalse('de' in pattern._regex_dict)
+            if hasattr(pattern, '_lang_reverse_dicts'):
+                self.assertTrue('fr' in pattern._lang_reverse_dicts)
+
+        resolver = transurlvania_resolvers.MultilangRegexURLResolver(r'^/', 'tests.urls')
+        routing_table.load_root_resolver(resolver, 'tests.urls', 'fr')
+        self.assertTrue('fr' in resolver._lang_reverse_dicts)
+        translation.activate('fr')
+        try:
+            self.assertEqual(resolver.resolve('/fr/a-propos-de-nous/')[0], about_us)
+        finally:
+            translation.deactivate()
+        self.assertEqual(reverse_for_language(about_us, 'fr', 'tests.urls'),
+                         '/fr/a-propos-de-nous/')
+        self.assertEqual(
+            reverse_for_language('admin:garfield_comicstrip_change', 'fr', 'tests.urls', args=[1]),
+            '/fr/admin/garfield/comicstrip/1/'
+        )
+
+    def testMismatch(self):
+        table = routing_table.build_routing_table('tests.urls', ['en'])
+        table['signatures'][0] = ('RegexURLPattern', r'^moved/$', None)
+        f = open(self.path, 'wb')
+        marshal.dump(table, f)
+        f.close()
+        self.assertFalse(routing_table.load_routing_table(self.path, 'tests.urls'))
+        self.assertFalse(routing_table.load_routing_table(self.path, 'garfield.urls'))
+
+    def testCatalogChanged(self):
+        routing_table.write_routing_table(self.path, 'tests.urls', ['en', 'fr'])
+        self.assertTrue(routing_table.load_routing_table(self.path, 'tests.urls'))
+        mo_file = os.path.join(os.path.dirname(__file__), 'locale', 'fr', 'LC_MESSAGES', 'django.mo')
+        stat = os.stat(mo_file)
+        os.utime(mo_file, (stat.st_atime, stat.st_mtime + 60))
+        try:
+            self.assertFalse(routing_table.load_routing_table(self.path, 'tests.urls'))
+        finally:
+            os.utime(mo_file, (stat.st_atime, stat.st_mtime))
+
+    def testLoadedOnHandlerResolve(self):
+        routing_table.write_routing_table(self.path, 'tests.urls', ['en', 'fr'])
+        forget_url_patterns('tests.urls')
+        routing_table._configured_urlconfs.clear()
+        old_table = transurlvania.settings.ROUTING_TABLE
+        transurlvania.settings.ROUTING_TABLE = self.path
+        translation.activate('fr')
+        try:
+            # Django's request handler resolves with a resolver of its own.
+            resolver = django_resolvers.RegexURLResolver(r'^/', 'tests.urls')
+            self.assertEqual(resolver.resolve('/fr/a-propos-de-nous/')[0], about_us)
+        finally:
+            transurlvania.settings.ROUTING_TABLE = old_table
+            routing_table._configured_urlconfs.clear()
+            translation.deactivate()
+        for pattern in routing_table.get_url_patterns('tests.urls'):
+            if getattr(pattern, '_raw_regex', None) == r'^about-us/$':
+                # Loaded from the table, which has no German.
+                self.assertEqual(set(pattern._regex_dict.keys()), set(['en', 'fr']))
+
+
+class CompactPatternTestCase(TestCase):
+    """
+    Test the pattern classes that keep their regexes in a tuple.
+    """
+    def setUp(self):
+        self.pattern = transurlvania_resolvers.CompactMultilangRegexURLPattern(
+            r'^about-us/$', about_us, name='about_us')
+        self.resolver = transurlvania_resolvers.CompactMultilangRegexURLResolver(
+            r'^/', transurlvania_resolvers.PocketURLModule([self.pattern]))
+
+    def tearDown(self):
+        translation.deactivate()
+
+    def testRegexes(self):
+        self.assertEqual(self.pattern.get_regex('fr').pattern, r'^a-propos-de-nous/$')
+        self.assertTrue(self.pattern.get_regex('fr') is self.pattern.get_regex('fr'))
+        self.assertEqual(self.pattern.get_regex('xx').pattern, r'^about-us/$')
+        self.assertEqual(sorted(self.pattern._regex_dict.keys()), ['fr', 'xx'])
+
+    def testAttributesInSlots(self):
+        translation.activate('fr')
+        self.resolver.resolve('/a-propos-de-nous/')
+        self.resolver.get_reverse_dict('fr')
+        # The instances have a __dict__, since Django's classes don't use
+        # slots, but nothing should have been stored in it.
+        dicts = [obj for obj in gc.get_referents(self.pattern) if isinstance(obj, dict)]
+        self.assertEqual(len(dicts), 1)
+        self.assertTrue(dicts[0] is self.pattern.default_args)
+        self.assertEqual(self.pattern.__dict__, {})
+        self.assertEqual(self.resolver.__dict__, {})
+
+    def testResolveAndReverse(self):
+        translation.activate('fr')
+        self.assertEqual(self.resolver.resolve('/a-propos-de-nous/')[0], about_us)
+        self.assertEqual(self.resolver.get_reverse_dict('fr').getlist('about_us')[0][1],
+                         u'a-propos-de-nous/$')
+
+
+class PrefixResolveEngineTestCase(TestCase):
+    """
+    Test resolving through the prefix-indexed resolve engine.
+    """
+    engine = 'prefix'
+
+    def setUp(self):
+        self.old_engine = transurlvania.settings.RESOLVE_ENGINE
+        transurlvania.settings.RESOLVE_ENGINE = self.engine
+        translation.activate('en')
+
+    def tearDown(self):
+        transurlvania.settings.RESOLVE_ENGINE = self.old_engine
+        translation.deactivate()
+
+    def testResolves(self):
+        resolver = transurlvania_resolvers.get_resolver(None, 'en')
+        self.assertEqual(resolver.resolve('/en/garfield/')[0], landing)
+        self.assertEqual(resolver.resolve('/en/about-us/')[0], about_us)
+        self.assertEqual(resolver.resolve('/en/garfield/jim-davis/')[0], jim_davis)
+        self.assertEqual(resolver.resolve('/')[0], detect_language_and_redirect)
+        translation.activate('fr')
+        resolver = transurlvania_resolvers.get_resolver(None, 'fr')
+        self.assertEqual(resolver.resolve('/fr/a-propos-de-nous/')[0], about_us)
+        self.assertEqual(resolver.resolve(u'/fr/garfield/le-président/')[0], the_president)
+
+    def testNoMatch(self):
+        resolver = transurlvania_resolvers.get_resolver(None, 'en')
+        self.assertRaises(Resolver404, resolver.resolve, '/en/a-propos-de-nous/')
+        self.assertRaises(Resolver404, resolver.resolve, '/fr/about-us/')
+
+    def testPage(self):
+        response = self.client.get('/fr/garfield/le-chat/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'garfield/comicstrip_list.html')
+
+    def testIndexIsUsed(self):
+        resolver = transurlvania_resolvers.get_resolver(None, 'en')
+        index = resolver.url_patterns[0].get_resolve_index('en')
+        self.assertTrue(isinstance(index, RESOLVE_INDEXES[self.engine]))
+        calls = []
+        def candidates(path):
+            calls.append(path)
+            return index.__class__.candidates(index, path)
+        index.candidates = candidates
+        try:
+            self.assertEqual(resolver.resolve('/en/about-us/')[0], about_us)
+        finally:
+            del index.candidates
+        self.assertEqual(calls, [u'about-us/'])
+
+
+class DirectLanguageDispatchTestCase(PrefixResolveEngineTestCase):
+    """
+    Test resolving with the language code checked without a regex.
+    """
+    engine = 'sequential'
+
+    def setUp(self):
+        super(DirectLanguageDispatchTestCase, self).setUp()
+        self.old_dispatch = transurlvania.settings.DIRECT_LANGUAGE_DISPATCH
+        transurlvania.settings.DIRECT_LANGUAGE_DISPATCH = True
+
+    def tearDown(self):
+        super(DirectLanguageDispatchTestCase, self).tearDown()
+        transurlvania.settings.DIRECT_LANGUAGE_DISPATCH = self.old_dispatch
+
+    def testSplitLangPrefix(self):
+        self.assertEqual(transurlvania_resolvers.split_lang_prefix('fr/a-propos-de-nous/'),
+                         ('fr', 'a-propos-de-nous/'))
+        self.assertEqual(transurlvania_resolvers.split_lang_prefix('fr/'), ('fr', ''))
+        self.assertEqual(transurlvania_resolvers.split_lang_prefix('fr'), ('fr', None))
+
+    def testRegexIsCached(self):
+        lang_resolver = transurlvania_resolvers.get_resolver(None, 'en').url_patterns[0]
+        self.assertTrue(lang_resolver.get_regex('fr') is lang_resolver.get_regex('fr'))
+        self.assertEqual(lang_resolver.get_regex('fr').pattern, '^fr/')
+
+    def testIndexIsUsed(self):
+        # The sequential engine doesn't use an index.
+        pass
+
+    def testTried(self):
+        resolver = transurlvania_resolvers.get_resolver(None, 'en')
+        try:
+            resolver.resolve('/en/nowhere/')
+        except Resolver404, e:
+            self.assertTrue(u'^en/   ^about-us/$' in e.args[0]['tried'])
+        else:
+            self.fail('Resolver404 not raised')
+
+
+class PrefixIndexTestCase(TestCase):
+    def testLiteralPrefix(self):
+        self.assertEqual(literal_prefix(r'^about-us/$'), u'about-us/')
+        self.assertEqual(literal_prefix(r'^the-cat/(?P<id>\d+)/$'), u'the-cat/')
+        self.assertEqual(literal_prefix(r'^comics\.xml$'), u'comics.xml')
+        self.assertEqual(literal_prefix(r'^pages?/$'), u'page')
+        self.assertEqual(literal_prefix(r'^a|b'), u'')
+        self.assertEqual(literal_prefix(r'about-us/$'), u'')
+
+    def testCandidatesKeepURLConfOrder(self):
+        index = PrefixIndex([r'^about/$', r'^$', r'^about/team/$', r'^contact/$'])
+        self.assertEqual(index.candidates(u'about/team/'), [0, 1, 2])
+        self.assertEqual(index.candidates(u'contact/'), [1, 3])
+
+
+class AlternationResolveEngineTestCase(PrefixResolveEngineTestCase):
+    """
+    Test resolving through the combined alternation regex resolve engine.
+    """
+    engine = 'alternation'
+
+
+class AlternationIndexTestCase(TestCase):
+    def testMakeGroupsNonCapturing(self):
+        self.assertEqual(make_groups_non_capturing(r'^(?P<id>\d+)/(\w+)/$'),
+                         r'^(?:\d+)/(?:\w+)/$')
+        self.assertEqual(make_groups_non_capturing(r'^[(]x(?:y)$'), r'^[(]x(?:y)$')
+        self.assertEqual(make_groups_non_capturing(r'^(a)\1$'), None)
+        self.assertEqual(make_groups_non_capturing(r'^(?i)a$'), None)
+
+    def testCandidatesKeepFirstMatchWins(self):
+        index = AlternationIndex([r'^about/$', r'^(?P<slug>[\w-]+)/$', r'^about/(\d+)/$'])
+        self.assertEqual(list(index.candidates(u'about/')), [0, 1, 2])
+        self.assertEqual(list(index.candidates(u'contact/')), [1, 2])
+        self.assertEqual(list(index.candidates(u'about/12/')), [2])
+        self.assertEqual(list(index.candidates(u'about/x/y/')), [])
+
+    def testUnanchoredFallsBackToAllChildren(self):
+        index = AlternationIndex([r'^about/$', r'contact/$'])
+        self.assertEqual(list(index.candidates(u'anything')), [0, 1])
+
+    def testTopLevelAlternationFallsBackToAllChildren(self):
+        self.assertTrue(has_top_level_alternation(r'^a|zz'))
+        self.assertFalse(has_top_level_alternation(r'^(a|zz)/$'))
+        self.assertFalse(has_top_level_alternation(r'^[|]\|/$'))
+        index = AlternationIndex([r'^about/$', r'^a|zz'])
+        self.assertEqual(list(index.candidates(u'xzz')), [0, 1])
+        self.assertTrue(re.search(r'^a|zz', u'xzz'))
+
+    def testManyChildren(self):
+        index = AlternationIndex([r'^page-%d/$' % i for i in range(250)])
+        self.assertEqual(list(index.candidates(u'page-242/')), range(242, 250))
+
+
+class ReverseIndexTestCase(TestCase):
+    """
+    Test the URL templates indexed by their arguments for reversing.
+    """
+    def setUp(self):
+        self.old_domains = transurlvania.settings.LANGUAGE_DOMAINS
+        transurlvania.settings.LANGUAGE_DOMAINS = {}
+
+    def tearDown(self):
+        transurlvania.settings.LANGUAGE_DOMAINS = self.old_domains
+
+    def testBuildReverseIndex(self):
+        from django.utils.regex_helper import normalize
+        pattern = r'comics/(?P<year>\d{4})/(?P<slug>[-\w]+)/$'
+        by_arity, by_kwarg_names = transurlvania_resolvers.build_reverse_index(
+            [(normalize(pattern), pattern)])
+        result, params, regex = by_kwarg_names[frozenset(['year', 'slug'])][0]
+        self.assertEqual(result, u'comics/%(year)s/%(slug)s/')
+        self.assertTrue(regex.search(u'comics/2010/lasagna/'))
+        self.assertFalse(regex.search(u'comics/10/lasagna/'))
+        self.assertEqual(by_arity[2][0][0], result)
+        self.assertFalse(1 in by_arity)
+
+    def testResolverReverseIndex(self):
+        resolver = transurlvania_resolvers.get_resolver(None, 'fr')
+        by_arity, by_kwarg_names = resolver.get_reverse_index(about_us, 'fr')
+        self.assertEqual([result for (result, params, regex) in by_kwarg_names[frozenset()]],
+                         [u'fr/a-propos-de-nous/'])
+        self.assertTrue(resolver.get_reverse_index(about_us, 'fr')[0] is by_arity)
+
+    def testReverseWithArguments(self):
+        self.assertEqual(
+            reverse_for_language('admin:garfield_comicstrip_change', 'fr', args=[1]),
+            '/fr/admin/garfield/comicstrip/1/'
+        )
+        self.assertRaises(NoReverseMatch, reverse_for_language,
+                          'admin:garfield_comicstrip_change', 'fr', args=[1, 2])
+        self.assertRaises(NoReverseMatch, reverse_for_language,
+                          'admin:garfield_comicstrip_change', 'fr', kwargs={'id': 1})
+
+
+class AllLanguagesReverseDictTestCase(TestCase):
+    """
+    Test building the reverse dicts for every language in one pass.
+    """
+    def make_resolver(self):
+        MultilangRegexURLPattern = transurlvania_resolvers.MultilangRegexURLPattern
+        MultilangRegexURLResolver = transurlvania_resolvers.MultilangRegexURLResolver
+        PocketURLModule = transurlvania_resolvers.PocketURLModule
+        return MultilangRegexURLResolver(r'^/', PocketURLModule([
+            MultilangRegexURLPattern(r'^about-us/$', about_us, name='about_us'),
+            MultilangRegexURLResolver(r'^garfield/', PocketURLModule([
+                MultilangRegexURLPattern(r'^jim-davis/(?P<id>\d+)/$', jim_davis, name='jim_davis'),
+            ])),
+        ]))
+
+    def testSameAsOneLanguageAtATime(self):
+        languages = ['en', 'fr', 'de']
+        one_pass = self.make_resolver()
+        one_pass.build_reverse_dicts(languages)
+        separate = self.make_resolver()
+        for lang in languages:
+            for name in ('about_us', 'jim_davis', about_us, jim_davis):
+                self.assertEqual(one_pass.get_reverse_dict(lang).getlist(name),
+                                 separate.get_reverse_dict(lang).getlist(name))
+
+    def testUntranslatedEntriesAreShared(self):
+        resolver = self.make_resolver()
+        resolver.build_reverse_dicts(['en', 'fr'])
+        en_dict = resolver.get_reverse_dict('en')
+        fr_dict = resolver.get_reverse_dict('fr')
+        self.assertTrue(en_dict.getlist('jim_davis')[0] is fr_dict.getlist('jim_davis')[0])
+        self.assertEqual(fr_dict.getlist('about_us')[0][1], u'a-propos-de-nous/$')
+        self.assertTrue(en_dict.getlist('about_us')[0] is not fr_dict.getlist('about_us')[0])
+
+
+class AdminLinked(object):
+    def __init__(self, pk, language):
+        self.pk = pk
+        self.language = language
+
+    @permalink_in_lang
+    def get_absolute_url(self):
+        return ('admin:garfield_comicstrip_change', self.language, (self.pk,))
+
+
+class Unlinked(object):
+    def get_absolute_url(self):
+        return '/unlinked/'
+
+
+class AdminLinkedStrip(ComicStrip):
+    class Meta:
+        proxy = True
+
+    @permalink_in_lang
+    def get_absolute_url(self):
+        if self.pk is None:
+            return ('admin:garfield_comicstrip_add', self.language)
+        return ('admin:garfield_comicstrip_change', self.language, (self.pk,))
+
+
+class ReverseManyTestCase(TestCase):
+    """
+    Test reversing URLs for many objects at once.
+    """
+    fixtures = ['test.json']
+
+    def setUp(self):
+        self.old_domains = transurlvania.settings.LANGUAGE_DOMAINS
+        transurlvania.settings.LANGUAGE_DOMAINS = {}
+        self.old_overrides = settings.ABSOLUTE_URL_OVERRIDES
+
+    def tearDown(self):
+        transurlvania.settings.LANGUAGE_DOMAINS = self.old_domains
+        settings.ABSOLUTE_URL_OVERRIDES = self.old_overrides
+        translation.deactivate()
+
+    def testSameAsReverseForLanguage(self):
+        lookups = [
+            ('admin:garfield_comicstrip_change', 'fr', [1], None),
+            (about_us, 'en', None, None),
+            ('admin:garfield_comicstrip_change', 'fr', [2], None),
+            (about_us, 'fr', None, {}),
+        ]
+        self.assertEqual(list(reverse_many(lookups)), [
+            reverse_for_language(viewname, lang, None, args, kwargs)
+            for (viewname, lang, args, kwargs) in lookups
+        ])
+
+    def testNoMatch(self):
+        lookups = [('admin:garfield_comicstrip_change', 'fr', None, {'id': 1})]
+        self.assertRaises(NoReverseMatch, list, reverse_many(lookups))
+
+    def testDomains(self):
+        transurlvania.settings.LANGUAGE_DOMAINS = {
+            'fr': ('www.trapeze-fr.com', 'French Site')
+        }
+        self.assertEqual(list(reverse_many([(about_us, 'fr', None, None)])),
+                         ['http://www.trapeze-fr.com/fr/a-propos-de-nous/'])
+
+    def testGetAbsoluteURLs(self):
+        first, second = AdminLinked(1, 'fr'), AdminLinked(2, 'en')
+        self.assertEqual(get_absolute_urls([first, second]), [
+            {'fr': '/fr/admin/garfield/comicstrip/1/'},
+            {'en': '/en/admin/garfield/comicstrip/2/'},
+        ])
+
+    def testGetAbsoluteURLsInLanguages(self):
+        strip = AdminLinked(1, 'fr')
+        get_absolute_urls([strip], ['en', 'fr'], annotate='urls')
+        self.assertEqual(strip.urls, {
+            'en': '/en/admin/garfield/comicstrip/1/',
+            'fr': '/fr/admin/garfield/comicstrip/1/',
+        })
+        self.assertEqual(strip.get_absolute_url(), strip.urls['fr'])
+
+    def testUndecoratedGetAbsoluteURL(self):
+        translation.activate('en')
+        obj = Unlinked()
+        self.assertEqual(get_absolute_urls([obj]), [{'en': '/unlinked/'}])
+        self.assertEqual(get_absolute_urls([obj], ['en', 'fr']), [{'en': '/unlinked/'}])
+        translation.activate('fr')
+        self.assertEqual(get_absolute_urls([obj], ['en']), [{'fr': '/unlinked/'}])
+
+    def testModelInstances(self):
+        strips = list(AdminLinkedStrip.objects.order_by('pk')[:2])
+        # Unsaved instances all compare equal, so they mustn't share URLs.
+        strips += [AdminLinkedStrip(language='en'), AdminLinkedStrip(language='fr')]
+        self.assertEqual(get_absolute_urls(strips, annotate='urls'), [
+            {'en': '/en/admin/garfield/comicstrip/1/'},
+            {'fr': '/fr/admin/garfield/comicstrip/2/'},
+            {'en': '/en/admin/garfield/comicstrip/add/'},
+            {'fr': '/fr/admin/garfield/comicstrip/add/'},
+        ])
+        self.assertEqual(strips[0].urls, {'en': strips[0].get_absolute_url()})
+        self.assertEqual(strips[3].urls, {'fr': strips[3].get_absolute_url()})
+
+    def testAbsoluteURLOverride(self):
+        settings.ABSOLUTE_URL_OVERRIDES = {
+            'garfield.adminlinkedstrip': lambda strip: '/strips/%s/' % (strip.pk or 'new'),
+        }
+        translation.activate('en')
+        strips = [AdminLinkedStrip.objects.get(pk=2), AdminLinkedStrip(language='fr')]
+        self.assertEqual(get_absolute_urls(strips, ['en', 'fr']),
+                         [{'en': '/strips/2/'}, {'en': '/strips/new/'}])
+        self.assertEqual(strips[0].get_absolute_url(), '/strips/2/')
+
+
+class ReverseCacheTestCase(TestCase):
+    """
+    Test the LRU cache of reverse_for_language results.
+    """
+    def setUp(self):
+        self.old_cache = transurlvania_resolvers.reverse_cache
+        transurlvania_resolvers.reverse_cache = LRUCache(10)
+        self.old_domains = transurlvania.settings.LANGUAGE_DOMAINS
+        transurlvania.settings.LANGUAGE_DOMAINS = {}
+
+    def tearDown(self):
+        transurlvania_resolvers.reverse_cache = self.old_cache
+        transurlvania.settings.LANGUAGE_DOMAINS = self.old_domains
+
+    def testHitsAndMisses(self):
+        cache = transurlvania_resolvers.reverse_cache
+        for i in range(3):
+            self.assertEqual(reverse_for_language(about_us, 'fr', 'tests.urls'),
+                             '/fr/a-propos-de-nous/')
+        self.assertEqual(reverse_for_language(about_us, 'en', 'tests.urls'),
+                         '/en/about-us/')
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(cache.stats()['misses'], 2)
+        self.assertEqual(len(cache), 2)
+
+    def testDomainIsAddedAfterCaching(self):
+        reverse_for_language(about_us, 'fr', 'tests.urls')
+        transurlvania.settings.LANGUAGE_DOMAINS = {
+            'fr': ('www.trapeze-fr.com', 'French Site')
+        }
+        self.assertEqual(reverse_for_language(about_us, 'fr', 'tests.urls'),
+                         'http://www.trapeze-fr.com/fr/a-propos-de-nous/')
+
+    def testResolverRebuildInvalidates(self):
+        reverse_for_language(about_us, 'fr', 'tests.urls')
+        reverse_for_language(about_us, 'en', 'tests.urls')
+        transurlvania_resolvers.resolver_registry.discard('tests.urls', 'fr')
+        transurlvania_resolvers.get_resolver('tests.urls', 'fr')
+        keys = transurlvania_resolvers.reverse_cache.keys()
+        self.assertEqual([key[1] for key in keys], ['en'])
+
+
+class ResolveCacheTestCase(TestCase):
+    """
+    Test the caches of resolved and unresolvable paths.
+    """
+    def setUp(self):
+        self.old_caches = (transurlvania_resolvers.resolve_cache,
+                           transurlvania_resolvers.resolve_404_cache)
+        transurlvania_resolvers.resolve_cache = LRUCache(10)
+        transurlvania_resolvers.resolve_404_cache = LRUCache(2)
+        translation.activate('fr')
+        self.resolver = transurlvania_resolvers.get_resolver(None, 'fr').url_patterns[0]
+
+    def tearDown(self):
+        (transurlvania_resolvers.resolve_cache,
+         transurlvania_resolvers.resolve_404_cache) = self.old_caches
+        translation.deactivate()
+
+    def testResolved(self):
+        path = u'fr/garfield/le-président/'
+        self.assertEqual(self.resolver.resolve(path)[0], the_president)
+        match = self.resolver.resolve(path)
+        self.assertEqual(match[0], the_president)
+        match[2]['changed'] = True
+        self.assertFalse('changed' in self.resolver.resolve(path)[2])
+        stats = transurlvania_resolvers.get_resolve_cache_stats()
+        # Only the outermost resolver uses the cache.
+        self.assertEqual(stats['resolved']['size'], 1)
+        self.assertEqual(stats['resolved']['hits'], 2)
+        translation.activate('en')
+        self.assertRaises(Resolver404, self.resolver.resolve, path)
+
+    def testNotFound(self):
+        for path in ('fr/a/', 'fr/b/', 'fr/c/'):
+            self.assertRaises(Resolver404, self.resolver.resolve, path)
+        self.assertRaises(Resolver404, self.resolver.resolve, 'fr/c/')
+        stats = transurlvania_resolvers.get_resolve_cache_stats()
+        self.assertEqual(stats['not found']['size'], 2)
+        self.assertEqual(stats['not found']['hits'], 1)
+        self.assertEqual(stats['resolved']['size'], 0)
+
+    def testPage(self):
+        response = self.client.get('/fr/garfield/le-chat/')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/fr/garfield/le-chat/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(transurlvania_resolvers.resolve_cache.hits, 1)
+
+
+class InstrumentationTestCase(TestCase):
+    """
+    Test the counts and timings recorded for URL translation.
+    """
+    def setUp(self):
+        self.events = []
+        self.signalled = []
+        def backend(event, key, seconds, info):
+            self.events.append((event, key, info))
+        def receiver(sender, event, key, seconds, info, **kwargs):
+            self.signalled.append(event)
+        self.receiver = receiver
+        instrumentation.url_translation_event.connect(receiver)
+        instrumentation.reset_stats()
+        instrumentation.enable(backend)
+
+    def tearDown(self):
+        instrumentation.disable()
+        instrumentation.url_translation_event.disconnect(self.receiver)
+        instrumentation._backend = instrumentation.NOT_LOADED
+        instrumentation.reset_stats()
+
+    def testRegexes(self):
+        pattern = transurlvania_resolvers.MultilangRegexURLPattern(r'^about-us/$', about_us)
+        pattern.get_regex('fr')
+        pattern.get_regex('fr')
+        stats = instrumentation.get_stats()
+        self.assertEqual(stats[('regex compile', 'fr')][0], 1)
+        self.assertEqual(stats[('gettext lookup', 'fr')][0], 1)
+        self.assertEqual(self.signalled, ['gettext lookup', 'regex compile'])
+
+    def testReverse(self):
+        resolver = transurlvania_resolvers.MultilangRegexURLResolver(r'^/',
+            transurlvania_resolvers.PocketURLModule([
+                transurlvania_resolvers.MultilangRegexURLPattern(r'^about-us/$', about_us),
+            ]))
+        resolver.build_reverse_dicts(['en', 'fr'])
+        stats = instrumentation.get_stats()
+        urlconf = repr(resolver.urlconf_name)
+        self.assertEqual(stats[('reverse dict build', (urlconf, 'fr'))][0], 1)
+
+        reverse_for_language(about_us, 'fr')
+        self.assertEqual(self.events[-1],
+                         ('reverse', ('garfield.views.about_us', 'fr'), {'candidates': 1}))
+
+    def testSchemeFallback(self):
+        view_info = ViewInfo('http://testserver/en/about-us/', about_us, (), {})
+        self.assertEqual(AutodetectScheme().get_url('fr', view_info, {}),
+                         'http://www.trapeze-fr.com/fr/a-propos-de-nous/')
+        fallbacks = [(key, info) for (event, key, info) in self.events
+                     if event == 'scheme fallback']
+        self.assertEqual(fallbacks,
+                         [(('object', 'view'), {'languages': ['fr'], 'view': 'garfield.views.about_us'})])
+
+    def testDisabled(self):
+        instrumentation.disable()
+        reverse_for_language(about_us, 'de')
+        self.assertEqual(instrumentation.get_stats(), {})
+        self.assertEqual(self.events, [])
+
+
+class URLTranslationReportTestCase(TestCase):
+    """
+    Test the per-request report of URL translation work.
+    """
+    def setUp(self):
+        self.old_report = transurlvania.middleware.URL_TRANSLATION_REPORT
+        transurlvania.middleware.URL_TRANSLATION_REPORT = True
+        self.middleware = transurlvania.middleware.URLTranslationReportMiddleware()
+
+    def tearDown(self):
+        transurlvania.middleware.URL_TRANSLATION_REPORT = self.old_report
+        instrumentation.disable()
+        instrumentation.reset_stats()
+        instrumentation.url_translation_event.disconnect(
+            dispatch_uid='transurlvania.middleware.URLTranslationReportMiddleware')
+
+    def make_request(self, **meta):
+        request = HttpRequest()
+        request.path = request.path_info = '/en/about-us/'
+        request.META.update(meta)
+        return request
+
+    def testReport(self):
+        request = self.make_request(HTTP_X_URL_TRANSLATION_REPORT='1')
+        self.middleware.process_request(request)
+        translator = URLTranslator('http://testserver/en/about-us/', AutodetectScheme())
+        translator.set_view_info(about_us, (), {})
+        translator.get_urls(['fr', 'de'], {})
+        response = self.middleware.process_response(request, HttpResponse('<p>Hi</p>'))
+        report = response['X-URL-Translation-Report']
+        self.assertTrue(report.startswith('reverse: 2 calls, 2 candidates, 0 cached, '))
+        self.assertTrue('fallback from object to view for fr,de' in report)
+        self.assertTrue('AutodetectScheme for fr,de: ' in report)
+        self.assertTrue('<!-- URL translation report:\nreverse: 2 calls' in response.content)
+
+    def testProducingScheme(self):
+        class FrenchOnly(object):
+            def get_translation(self, lang):
+                if lang == 'fr':
+                    return self
+
+            def get_absolute_url(self):
+                return '/fr/a-propos-de-nous/'
+        request = self.make_request(HTTP_X_URL_TRANSLATION_REPORT='1')
+        self.middleware.process_request(request)
+        translator = URLTranslator('http://testserver/en/about-us/', AutodetectScheme())
+        translator.set_view_info(about_us, (), {})
+        translator.get_urls(['fr', 'de'], {'object': FrenchOnly()})
+        response = self.middleware.process_response(request, HttpResponse(''))
+        lines = response['X-URL-Translation-Report'].split('; ')
+        lookups = [line for line in lines if line.startswith('AutodetectScheme for')]
+        self.assertEqual(len(lookups), 1)
+        # Counted directly, so the count doesn't depend on DEBUG.
+        self.assertTrue(lookups[0].endswith(
+            ', 2 translation lookups (fr from ObjectBasedScheme, de from DirectToURLScheme)'))
+
+    def testNotRequested(self):
+        request = self.make_request()
+        self.middleware.process_request(request)
+        reverse_for_language(about_us, 'fr')
+        response = self.middleware.process_response(request, HttpResponse('<p>Hi</p>'))
+        self.assertFalse(response.has_header('X-URL-Translation-Report'))
+        self.assertEqual(response.content, '<p>Hi</p>')
+
+
+class Translated(object):
+    """
+    Item with a translation in each of ``urls``' languages.
+    """
+    def __init__(self, urls):
+        self.urls = urls
+
+    def get_translation(self, lang):
+        if lang not in self.urls:
+            raise ObjectDoesNotExist
+        return Translated({lang: self.urls[lang]})
+
+    def get_absolute_url(self):
+        return self.urls.values()[0]
+
+
+class TranslatedSet(object):
+    """
+    Item that gets all of its translations at once. Languages mapped onto
+    None are missing.
+    """
+    def __init__(self, urls):
+        self.urls = urls
+
+    def get_translations(self, langs):
+        translations = {}
+        for lang in langs:
+            if lang in self.urls:
+                translations[lang] = self.urls[lang] and Translated({lang: self.urls[lang]})
+        return translations
+
+
+class TranslatedSitemap(sitemaps.MultilangSitemap):
+    languages = ['en', 'fr']
+    chunk_size = 2
+    changefreq = 'daily'
+
+    def __init__(self, items):
+        self.item_list = items
+
+    def items(self):
+        return self.item_list
+
+
+class SitemapTestCase(TestCase):
+    """
+    Test the multilingual sitemaps.
+    """
+    fixtures = ['test.json']
+
+    def setUp(self):
+        self.old_max_entries = sitemaps.MAX_ENTRIES
+        self.old_domains = transurlvania.settings.LANGUAGE_DOMAINS
+        transurlvania.settings.LANGUAGE_DOMAINS = {}
+
+    def tearDown(self):
+        sitemaps.MAX_ENTRIES = self.old_max_entries
+        transurlvania.settings.LANGUAGE_DOMAINS = self.old_domains
+
+    def testEntries(self):
+        sitemap = TranslatedSitemap([
+            Translated({'en': '/en/one/', 'fr': '/fr/un/'}),
+            Translated({'fr': '/fr/deux/'}),
+        ])
+        self.assertEqual([(lang, url, urls) for (item, lang, url, urls) in sitemap.iter_entries()], [
+            ('en', '/en/one/', {'en': '/en/one/', 'fr': '/fr/un/'}),
+            ('fr', '/fr/un/', {'en': '/en/one/', 'fr': '/fr/un/'}),
+            ('fr', '/fr/deux/', {'fr': '/fr/deux/'}),
+        ])
+
+    def testMissingTranslations(self):
+        sitemap = TranslatedSitemap([
+            TranslatedSet({'en': '/en/one/', 'fr': None}),
+            TranslatedSet({'en': '/en/two/', 'fr': '/fr/deux/'}),
+        ])
+        xml = ''.join(sitemaps.iter_sitemap_xml([sitemap], domain='testserver'))
+        self.assertEqual(xml.count('<url>'), 3)
+        self.assertTrue('<loc>http://testserver/en/one/</loc>' in xml)
+        self.assertTrue(xml.endswith('</urlset>\n'))
+
+    def testXML(self):
+        sitemap = TranslatedSitemap([Translated({'en': '/en/one/', 'fr': '/fr/un/'})])
+        xml = ''.join(sitemaps.iter_sitemap_xml([sitemap], domain='testserver'))
+        self.assertTrue(xml.startswith('<?xml'))
+        self.assertTrue(
+            '<url><loc>http://testserver/fr/un/</loc>'
+            '<xhtml:link rel="alternate" hreflang="en" href="http://testserver/en/one/"/>'
+            '<xhtml:link rel="alternate" hreflang="fr" href="http://testserver/fr/un/"/>'
+            '<changefreq>daily</changefreq></url>' in xml
+        )
+        self.assertTrue(xml.endswith('</urlset>\n'))
+
+    def testPaging(self):
+        sitemaps.MAX_ENTRIES = 6
+        sitemap = TranslatedSitemap([Translated({'en': '/en/%s/' % i}) for i in range(7)])
+        self.assertEqual(sitemap.get_items_per_page(), 3)
+        self.assertEqual(sitemap.get_num_pages(), 3)
+        self.assertEqual([[item.urls['en'] for item in chunk] for chunk in sitemap.iter_chunks(2)],
+                         [['/en/3/', '/en/4/'], ['/en/5/']])
+        self.assertEqual(list(sitemap.iter_chunks(4)), [])
+
+    def testQuerySetItems(self):
+        sitemap = TranslatedSitemap(ComicStrip.objects.order_by('pk'))
+        self.assertEqual(sitemap.get_num_pages(), 1)
+        chunks = list(sitemap.iter_chunks())
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+        self.assertEqual([strip.pk for strip in chunks[1]], [3])
+
+    def testViewSitemapUsesLanguageDomains(self):
+        transurlvania.settings.LANGUAGE_DOMAINS = {
+            'fr': ('www.trapeze-fr.com', 'French Site')
+        }
+        sitemap = sitemaps.ViewSitemap([about_us], ['en', 'fr'])
+        xml = ''.join(sitemaps.iter_sitemap_xml([sitemap], domain='testserver'))
+        self.assertTrue('<loc>http://testserver/en/about-us/</loc>' in xml)
+        self.assertTrue('<loc>http://www.trapeze-fr.com/fr/a-propos-de-nous/</loc>' in xml)
+
+    def testViews(self):
+        response = self.client.get('/sitemap.xml')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('<sitemap><loc>http://testserver/sitemap-pages.xml</loc></sitemap>'
+                        in response.content)
+        response = self.client.get('/sitemap-pages.xml')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('hreflang="fr" href="http://testserver/fr/garfield/le-pr%C3%A9sident/"'
+                        in response.content)
+        self.assertEqual(self.client.get('/sitemap-pages.xml?p=2').status_code, 404)
+        self.assertEqual(self.client.get('/sitemap-nothing.xml').status_code, 404)
+
+    def testWithoutSection(self):
+        request = HttpRequest()
+        request.META = {'SERVER_NAME': 'testserver', 'SERVER_PORT': '80'}
+        from transurlvania.views import sitemap
+        pages = sitemaps.ViewSitemap([about_us], ['en'])
+        content = sitemap(request, {'pages': pages}).content
+        self.assertTrue('<urlset' in content)
+        self.assertTrue('<loc>http://testserver/en/about-us/</loc>' in content)
+
+        # More than one section, or page, is too much for one file.
+        content = sitemap(request, {'pages': pages, 'more': pages}).content
+        self.assertTrue('<sitemapindex' in content)
+        self.assertTrue('<loc>http://testserver/sitemap-more.xml</loc>' in content)
+        sitemaps.MAX_ENTRIES = 1
+        response = sitemap(request, {'pages': sitemaps.ViewSitemap([about_us, home], ['en'])})
+        self.assertTrue('<loc>http://testserver/sitemap-pages.xml?p=2</loc>' in response.content)
+
+
+class LRUCacheTestCase(TestCase):
+    def testEvictsLeastRecentlyUsed(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertEqual(cache.keys(), ['a', 'c'])
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'size': 2, 'maxsize': 2})
+
+    def testDiscard(self):
+        cache = LRUCache(5)
+        for key in range(5):
+            cache.set(key, key)
+        cache.discard(0)
+        cache.discard_where(lambda key: key % 2)
+        self.assertEqual(cache.keys(), [2, 4])
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
 class LangInPathTestCase(TestCase):
     """
     Test language setting via URL path
@@ -92,10 +1195,13 @@ class LangInPathTestCase(TestCase):
     MIDDLEWARE_CLASSES for these tests to run properly.
     """
     def setUp(self):
+        self.old_domains = transurlvania.settings.LANGUAGE_DOMAINS
+        transurlvania.settings.LANGUAGE_DOMAINS = {}
         translation.activate('en')
 
     def tearDown(self):
         translation.deactivate()
+        transurlvania.settings.LANGUAGE_DOMAINS = self.old_domains
 
     def testLangDetectionViewRedirectsToLang(self):
         self.client.cookies['django_language'] = 'de'
@@ -153,6 +1259,7 @@ class LangInDomainTestCase(TestCase):
     urls = 'tests.urls_without_lang_prefix'
 
     def setUp(self):
+        self.old_domains = transurlvania.settings.LANGUAGE_DOMAINS
         transurlvania.settings.LANGUAGE_DOMAINS = {
             'en': ('www.trapeze-en.com', 'English Site'),
             'fr': ('www.trapeze-fr.com', 'French Site')
@@ -160,7 +1267,7 @@ class LangInDomainTestCase(TestCase):
 
     def tearDown(self):
         translation.deactivate()
-        transurlvania.settings.LANGUAGE_DOMAINS = {}
+        transurlvania.settings.LANGUAGE_DOMAINS = self.old_domains
 
     def testRootURL(self):
         translation.activate('en')
@@ -256,14 +1363,74 @@ class LangInDomainTestCase(TestCase):
 
 
 
+class LangInDomainIndexTestCase(TestCase):
+    """
+    Test the host to language index built by LangInDomainMiddleware.
+    """
+    def setUp(self):
+        self.old_domains = transurlvania.middleware.LANGUAGE_DOMAINS
+        self.old_aliases = transurlvania.middleware.LANGUAGE_DOMAIN_ALIASES
+        transurlvania.middleware.LANGUAGE_DOMAINS = {
+            'en': ('www.trapeze-en.com', 'English Site'),
+            'fr': ('www.trapeze-fr.com', 'French Site'),
+        }
+        transurlvania.middleware.LANGUAGE_DOMAIN_ALIASES = {
+            'fr': ('trapeze.fr', 'preview.trapeze-en.com:8000', '*.trapeze-fr.com'),
+            'de': ('*.de.trapeze-fr.com',),
+        }
+        self.middleware = transurlvania.middleware.LangInDomainMiddleware()
+
+    def tearDown(self):
+        transurlvania.middleware.LANGUAGE_DOMAINS = self.old_domains
+        transurlvania.middleware.LANGUAGE_DOMAIN_ALIASES = self.old_aliases
+        translation.deactivate()
+
+    def testHosts(self):
+        lang_for = self.middleware.get_lang_for_host
+        self.assertEqual(lang_for('www.trapeze-en.com'), 'en')
+        self.assertEqual(lang_for('WWW.Trapeze-EN.com:8080'), 'en')
+        self.assertEqual(lang_for('trapeze.fr'), 'fr')
+        self.assertEqual(lang_for('preview.trapeze-en.com:8000'), 'fr')
+        self.assertEqual(lang_for('preview.trapeze-en.com'), None)
+        self.assertEqual(lang_for('shop.trapeze-fr.com'), 'fr')
+        self.assertEqual(lang_for('shop.de.trapeze-fr.com'), 'de')
+        self.assertEqual(lang_for('trapeze-fr.com'), None)
+        self.assertEqual(lang_for('www.example.com'), None)
+
+    def testProcessRequestFallsBackToHTTPHost(self):
+        request = HttpRequest()
+        request.META = {'SERVER_NAME': 'localhost', 'HTTP_HOST': 'trapeze.fr'}
+        self.middleware.process_request(request)
+        self.assertEqual(request.LANGUAGE_CODE, 'fr')
+
+    def testCacheIsBounded(self):
+        self.middleware.max_cached_hosts = 2
+        lang_for = self.middleware.get_lang_for_host
+        self.assertEqual(lang_for('www.trapeze-en.com'), 'en')
+        self.assertEqual(lang_for('trapeze.fr'), 'fr')
+        self.assertEqual(self.middleware.matched_hosts,
+                         {'www.trapeze-en.com': 'en', 'trapeze.fr': 'fr'})
+        # The cache is full, so it's cleared before the next host is added.
+        self.assertEqual(lang_for('shop.de.trapeze-fr.com'), 'de')
+        self.assertEqual(self.middleware.matched_hosts, {'shop.de.trapeze-fr.com': 'de'})
+        self.assertEqual(lang_for('www.trapeze-en.com'), 'en')
+        self.assertEqual(lang_for('trapeze.fr'), 'fr')
+        self.assertEqual(self.middleware.matched_hosts, {'trapeze.fr': 'fr'})
+
+
 class LanguageSwitchingTestCase(TestCase):
     fixtures = ['test.json']
     """
     Test the language switching functionality of transurlvania (which also tests
     the `this_page_in_lang` template tag).
     """
+    def setUp(self):
+        self.old_domains = transurlvania.settings.LANGUAGE_DOMAINS
+        transurlvania.settings.LANGUAGE_DOMAINS = {}
+
     def tearDown(self):
         translation.deactivate()
+        transurlvania.settings.LANGUAGE_DOMAINS = self.old_domains
 
     def testDefaultViewBasedSwitching(self):
         response = self.client.get('/en/about-us/')
@@ -312,6 +1479,227 @@ class LanguageSwitchingTestCase(TestCase):
 # translation schemes.
 
 
+class TranslatedThing(object):
+    def __init__(self, lang, translations=None):
+        self.lang = lang
+        self.translations = translations
+        self.batch_lookups = 0
+
+    def get_absolute_url(self):
+        return '/%s/thing/' % self.lang
+
+    def get_translations(self, langs):
+        self.batch_lookups += 1
+        return dict([(lang, translation) for (lang, translation)
+                     in self.translations.items() if lang in langs])
+
+
+class CountingScheme(ObjectBasedScheme):
+    def __init__(self, *args, **kwargs):
+        super(CountingScheme, self).__init__(*args, **kwargs)
+        self.lookups = []
+
+    def get_url(self, lang, view_info, context=None):
+        self.lookups.append(lang)
+        if lang == 'de':
+            raise NoTranslationError('No German')
+        return '/%s/%s/' % (lang, id(context.get('object')))
+
+
+class ContextValueScheme(BasicScheme):
+    """
+    Custom scheme whose URLs depend on a value in the context.
+    """
+    def get_url(self, lang, view_info, context=None):
+        return '/%s/%s/' % (lang, context['slug'])
+
+
+class URLTranslatorCacheTestCase(TestCase):
+    """
+    Test that URLTranslator reuses the URLs it gets from its scheme.
+    """
+    def setUp(self):
+        self.scheme = CountingScheme()
+        self.translator = URLTranslator('http://testserver/en/about-us/', self.scheme)
+        self.context = Context({'object': TranslatedThing('en')})
+
+    def testRepeatedLookups(self):
+        url = self.translator.get_url('fr', self.context)
+        self.assertEqual(self.translator.get_url('fr', self.context), url)
+        self.assertRaises(NoTranslationError, self.translator.get_url, 'de', self.context)
+        self.assertRaises(NoTranslationError, self.translator.get_url, 'de', self.context)
+        self.assertEqual(self.scheme.lookups, ['fr', 'de'])
+        self.assertEqual(self.translator.get_urls(['fr', 'de'], self.context), [('fr', url)])
+        self.assertEqual(self.scheme.lookups, ['fr', 'de'])
+
+    def testContextObjectChange(self):
+        self.translator.get_url('fr', self.context)
+        self.context['object'] = TranslatedThing('en')
+        self.translator.get_url('fr', self.context)
+        self.assertEqual(self.scheme.lookups, ['fr', 'fr'])
+
+    def testViewInfoChange(self):
+        self.translator.get_url('fr', self.context)
+        self.translator.set_view_info(about_us, (), {})
+        self.translator.get_url('fr', self.context)
+        self.assertEqual(self.scheme.lookups, ['fr', 'fr'])
+
+    def testCustomSchemeInLoop(self):
+        self.translator.scheme = ContextValueScheme()
+        template = Template('{% load transurlvania_tags %}'
+            '{% for slug in slugs %}{% this_page_in_lang "fr" %} {% endfor %}'
+        )
+        output = template.render(Context({
+            '_url_translator': self.translator,
+            'slugs': ['a', 'b', 'c'],
+        }))
+        self.assertEqual(output, '/fr/a/ /fr/b/ /fr/c/ ')
+
+    def testSchemeChange(self):
+        self.translator.get_url('fr', self.context)
+        self.translator.scheme = BasicScheme()
+        self.assertEqual(self.translator.get_url('fr', self.context),
+                         'http://testserver/en/about-us/')
+
+
+class CountingRequest(HttpRequest):
+    absolute_uri_builds = 0
+
+    def build_absolute_uri(self, location=None):
+        self.absolute_uri_builds += 1
+        return 'http://testserver%s' % self.path
+
+
+class LazyURLTranslatorTestCase(TestCase):
+    """
+    Test that URLTransMiddleware only creates translators when they're used.
+    """
+    def setUp(self):
+        self.old_domains = transurlvania.settings.LANGUAGE_DOMAINS
+        transurlvania.settings.LANGUAGE_DOMAINS = {}
+        self.old_excluded_paths = transurlvania.middleware.URL_TRANSLATION_EXCLUDED_PATHS
+        transurlvania.middleware.URL_TRANSLATION_EXCLUDED_PATHS = ('/api/', '/health')
+        self.middleware = transurlvania.middleware.URLTransMiddleware()
+
+    def tearDown(self):
+        transurlvania.settings.LANGUAGE_DOMAINS = self.old_domains
+        transurlvania.middleware.URL_TRANSLATION_EXCLUDED_PATHS = self.old_excluded_paths
+
+    def makeRequest(self, path):
+        request = CountingRequest()
+        request.path = request.path_info = path
+        self.middleware.process_request(request)
+        self.middleware.process_view(request, about_us, (), {})
+        return request
+
+    def testTranslatorCreatedOnFirstUse(self):
+        request = self.makeRequest('/en/about-us/')
+        self.assertEqual(request.absolute_uri_builds, 0)
+        self.assertEqual(request.url_translator.get_url('fr', {}), '/fr/a-propos-de-nous/')
+        self.assertEqual(request.url_translator.get_url('de', {}), '/de/about-us/')
+        self.assertEqual(request.absolute_uri_builds, 1)
+
+    def testSchemeSetBeforeFirstUse(self):
+        request = self.makeRequest('/en/about-us/')
+        request.url_translator.scheme = BasicScheme()
+        self.assertEqual(request.url_translator.get_url('fr'),
+                         'http://testserver/en/about-us/')
+
+    def testNoReferenceCycle(self):
+        request = self.makeRequest('/en/about-us/')
+        request_ref = weakref.ref(request)
+        gc.disable()
+        try:
+            del request
+            self.assertTrue(request_ref() is None)
+        finally:
+            gc.enable()
+
+    def testExcludedPaths(self):
+        request = self.makeRequest('/api/comics/')
+        self.assertFalse(hasattr(request, 'url_translator'))
+        request = self.makeRequest('/healthcheck')
+        self.assertFalse(hasattr(request, 'url_translator'))
+
+
+class AllLanguagesSwitchingTestCase(TestCase):
+    """
+    Test getting the URLs for the current page in every language at once.
+    """
+    def setUp(self):
+        self.old_domains = transurlvania.settings.LANGUAGE_DOMAINS
+        transurlvania.settings.LANGUAGE_DOMAINS = {}
+        self.translator = URLTranslator('http://testserver/en/about-us/',
+                                        AutodetectScheme())
+        self.translator.set_view_info(about_us, (), {})
+
+    def tearDown(self):
+        transurlvania.settings.LANGUAGE_DOMAINS = self.old_domains
+
+    def testObjectTranslations(self):
+        thing = TranslatedThing('en')
+        thing.translations = {'en': thing, 'fr': TranslatedThing('fr')}
+        context = Context({'object': thing})
+        self.assertEqual(self.translator.get_urls(context=context), [
+            ('en', '/en/thing/'),
+            ('fr', '/fr/thing/'),
+            ('de', '/de/about-us/'),
+        ])
+        self.assertEqual(thing.batch_lookups, 1)
+
+    def testWithoutContext(self):
+        scheme = ObjectBasedScheme()
+        view_info = ViewInfo('http://testserver/en/about-us/', about_us, (), {})
+        self.assertRaises(NoTranslationError, scheme.get_urls, ['fr'], view_info)
+        self.assertRaises(NoTranslationError, scheme.get_url, 'fr', view_info)
+        self.assertEqual(self.translator.get_urls(), [
+            ('en', '/en/about-us/'),
+            ('fr', '/fr/a-propos-de-nous/'),
+            ('de', '/de/about-us/'),
+        ])
+
+    def testTranslationWithoutURL(self):
+        thing = TranslatedThing('en')
+        thing.translations = {'en': thing, 'fr': object()}
+        context = Context({'object': thing})
+        view_info = ViewInfo('http://testserver/en/about-us/', about_us, (), {})
+        self.assertEqual(ObjectBasedScheme().get_urls(['en', 'fr'], view_info, context),
+                         {'en': '/en/thing/'})
+        self.assertEqual(self.translator.get_urls(context=context), [
+            ('en', '/en/thing/'),
+            ('fr', '/fr/a-propos-de-nous/'),
+            ('de', '/de/about-us/'),
+        ])
+
+    def testResultIsKept(self):
+        thing = TranslatedThing('en', {})
+        context = Context({'object': thing})
+        self.translator.get_urls(context=context)
+        self.translator.get_urls(context=context)
+        self.assertEqual(thing.batch_lookups, 1)
+        self.translator.set_view_info(about_us, (), {})
+        self.translator.get_urls(context=context)
+        self.assertEqual(thing.batch_lookups, 2)
+
+    def testTag(self):
+        template = Template('{% load transurlvania_tags %}'
+            '{% this_page_in_langs as lang_urls %}'
+            '{% for lang, url in lang_urls %}{{ lang }}={{ url }};{% endfor %}'
+        )
+        output = template.render(Context({'_url_translator': self.translator}))
+        self.assertEqual(output, 'en=/en/about-us/;fr=/fr/a-propos-de-nous/;de=/de/about-us/;')
+
+    def testTagWithoutTranslator(self):
+        template = Template('{% load transurlvania_tags %}'
+            '{% this_page_in_langs as lang_urls %}{{ lang_urls|length }}'
+        )
+        self.assertEqual(template.render(Context({})), '0')
+
+    def testTagRequiresVariable(self):
+        self.assertRaises(TemplateSyntaxError, Template,
+            '{% load transurlvania_tags %}{% this_page_in_langs %}')
+
+
 class TransInLangTagTestCase(TestCase):
     """Tests for the `trans_in_lang` template tag."""
 
@@ -380,6 +1768,34 @@ class TransInLangTagTestCase(TestCase):
         output = template.render(Context())
         self.assertEquals(output, u'French|Français|Französisch')
 
+    def testCached(self):
+        """
+        Tests that languages are only checked once, and translations are
+        remembered up to a limit.
+        """
+        from transurlvania.templatetags import transurlvania_tags
+        checked = []
+        def check_for_language(lang):
+            checked.append(lang)
+            return lang != 'xx'
+        old_check_for_language = transurlvania_tags.check_for_language
+        old_max = transurlvania_tags.max_cached_translations
+        transurlvania_tags.check_for_language = check_for_language
+        transurlvania_tags.max_cached_translations = 2
+        transurlvania_tags.reset_trans_in_lang_cache()
+        try:
+            self.assertEquals(transurlvania_tags.trans_in_lang('French', 'fr'), u'Français')
+            self.assertEquals(transurlvania_tags.trans_in_lang('French', 'xx'), u'French')
+            self.assertEquals(transurlvania_tags.trans_in_lang('French', 'xx'), u'French')
+            self.assertEquals(sorted(checked), ['de', 'en', 'fr', 'xx'])
+            self.assertEquals(len(transurlvania_tags._translations), 2)
+            transurlvania_tags.trans_in_lang('German', 'fr')
+            self.assertEquals(transurlvania_tags._translations.keys(), [('fr', 'German')])
+        finally:
+            transurlvania_tags.check_for_language = old_check_for_language
+            transurlvania_tags.max_cached_translations = old_max
+            transurlvania_tags.reset_trans_in_lang_cache()
+
 
 def CompleteURLTestCase(TestCase):
     """
@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.utils.translation import ugettext_noop as _
 
 from transurlvania.defaults import *
+from transurlvania.sitemaps import ViewSitemap
 
 admin.autodiscover()
 
@@ -13,6 +14,12 @@ urlpatterns = lang_prefixed_patterns('garfield.views',
 )
 
 
+sitemaps = {
+    'pages': ViewSitemap(['about_us', 'garfield_the_president']),
+}
+
 urlpatterns += patterns('transurlvania.views',
     (r'^$', 'detect_language_and_redirect'),
+    (r'^sitemap\.xml$', 'sitemap_index', {'sitemaps': sitemaps}),
+    (r'^sitemap-(?P<section>.+)\.xml$', 'sitemap', {'sitemaps': sitemaps}),
     )
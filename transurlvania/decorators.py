@@ -32,4 +32,6 @@ def permalink_in_lang(func):
     def inner(*args, **kwargs):
         bits = func(*args, **kwargs)
         return reverse_for_language(bits[0], bits[1], None, *bits[2:4])
+    # Lets get_absolute_urls reverse URLs for many objects at once.
+    inner.permalink_bits = func
     return inner
@@ -4,7 +4,10 @@ from django.core.urlresolvers import RegexURLPattern
 from transurlvania.urlresolvers import LangSelectionRegexURLResolver
 from transurlvania.urlresolvers import MultilangRegexURLResolver
 from transurlvania.urlresolvers import MultilangRegexURLPattern
+from transurlvania.urlresolvers import CompactMultilangRegexURLResolver
+from transurlvania.urlresolvers import CompactMultilangRegexURLPattern
 from transurlvania.urlresolvers import PocketURLModule
+import transurlvania.settings
 
 
 def lang_prefixed_patterns(prefix, *args):
@@ -17,13 +20,19 @@ def url(regex, view, kwargs=None, name=None, prefix=''):
     if isinstance(view, (list,tuple)):
         # For include(...) processing.
         urlconf_module, app_name, namespace = view
-        return MultilangRegexURLResolver(regex, urlconf_module, kwargs, app_name=app_name, namespace=namespace)
+        if transurlvania.settings.COMPACT_PATTERNS:
+            resolver_class = CompactMultilangRegexURLResolver
+        else:
+            resolver_class = MultilangRegexURLResolver
+        return resolver_class(regex, urlconf_module, kwargs, app_name=app_name, namespace=namespace)
     else:
         if isinstance(view, basestring):
             if not view:
                 raise ImproperlyConfigured('Empty URL pattern view name not permitted (for pattern %r)' % regex)
             if prefix:
                 view = prefix + '.' + view
+        if transurlvania.settings.COMPACT_PATTERNS:
+            return CompactMultilangRegexURLPattern(regex, view, kwargs, name)
         return MultilangRegexURLPattern(regex, view, kwargs, name)
 
 # Copied from django.conf.urls.defaults so that it's invoking the url func
@@ -0,0 +1,217 @@
+"""
+Indexes used by MultilangRegexURLResolver to narrow down which of its child
+patterns need to be tried when resolving a path, instead of trying every one of
+them in turn.
+
+An index is built from the regex strings of a resolver's children, translated
+into one language, in URLconf order. Its ``candidates`` method takes the path
+left over once the resolver's own regex has matched and returns the positions
+of the children that could match it, in URLconf order. The resolver still
+calls ``resolve`` on each candidate, so the results are the same as trying
+every child.
+"""
+import re
+
+
+REGEX_SPECIAL_CHARS = '.^$*+?{}[]()|'
+OPTIONAL_QUANTIFIERS = '*?{'
+inline_flags_re = re.compile(r'\(\?[iLmsux]')
+
+
+def literal_prefix(regex):
+    """
+    Returns the literal text that every string matched by ``regex`` (using
+    ``search``) must start with, or an empty string if there isn't any.
+    """
+    if not regex.startswith('^') or '|' in regex or inline_flags_re.search(regex):
+        return u''
+    prefix = []
+    i = 1
+    while i < len(regex):
+        char = regex[i]
+        if char == '\\':
+            if i + 1 == len(regex) or regex[i + 1].isalnum():
+                # Character classes (\d, \w...), anchors and backreferences.
+                break
+            prefix.append(regex[i + 1])
+            i += 2
+        elif char in REGEX_SPECIAL_CHARS:
+            if char in OPTIONAL_QUANTIFIERS and prefix:
+                # The quantifier makes the last literal character optional.
+                prefix.pop()
+            break
+        else:
+            prefix.append(char)
+            i += 1
+    return u''.join(prefix)
+
+
+class PrefixIndex(object):
+    """
+    Character trie of the literal text at the start of each child's regex.
+    Children without any literal prefix sit at the root of the trie and are
+    candidates for every path.
+    """
+    def __init__(self, regexes):
+        # Each node is a (children, positions) pair.
+        self._root = ({}, [])
+        for position, regex in enumerate(regexes):
+            node = self._root
+            for char in literal_prefix(regex):
+                node = node[0].setdefault(char, ({}, []))
+            node[1].append(position)
+
+    def candidates(self, path):
+        node = self._root
+        positions = list(node[1])
+        for char in path:
+            node = node[0].get(char)
+            if node is None:
+                break
+            positions.extend(node[1])
+        positions.sort()
+        return positions
+
+
+def make_groups_non_capturing(regex):
+    """
+    Returns ``regex`` with all of its capturing groups turned into
+    non-capturing ones, or None if it uses a construct that depends on its
+    groups (backreferences, conditionals) or on global flags.
+    """
+    output = []
+    in_class = False
+    i = 0
+    while i < len(regex):
+        char = regex[i]
+        if char == '\\':
+            if regex[i + 1:i + 2].isdigit():
+                return None
+            output.append(regex[i:i + 2])
+            i += 2
+        elif in_class:
+            if char == ']':
+                in_class = False
+            output.append(char)
+            i += 1
+        elif char == '[':
+            in_class = True
+            output.append(char)
+            i += 1
+            # A closing bracket right at the start of a class is a literal.
+            if regex[i:i + 1] == '^':
+                output.append('^')
+                i += 1
+            if regex[i:i + 1] == ']':
+                output.append(']')
+                i += 1
+        elif regex.startswith('(?P<', i):
+            output.append('(?:')
+            i = regex.index('>', i) + 1
+        elif regex.startswith('(?', i):
+            if regex[i + 2:i + 3] not in (':', '=', '!', '<', '#'):
+                return None
+            output.append('(?')
+            i += 2
+        elif char == '(':
+            output.append('(?:')
+            i += 1
+        else:
+            output.append(char)
+            i += 1
+    return u''.join(output)
+
+
+def has_top_level_alternation(regex):
+    """
+    Returns True if ``regex`` has a ``|`` outside of any group, which leaves
+    the alternatives after it unanchored even if the regex starts with ``^``.
+    """
+    depth = 0
+    in_class = False
+    i = 0
+    while i < len(regex):
+        char = regex[i]
+        if char == '\\':
+            i += 2
+            continue
+        if in_class:
+            if char == ']':
+                in_class = False
+        elif char == '[':
+            in_class = True
+            # A closing bracket right at the start of a class is a literal.
+            if regex[i + 1:i + 2] == '^':
+                i += 1
+            if regex[i + 1:i + 2] == ']':
+                i += 1
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return True
+        i += 1
+    return False
+
+
+class AlternationIndex(object):
+    """
+    Combines the children's regexes into one alternation, with a named marker
+    group around each child, so a single ``match`` call finds the first child
+    that matches. Python tries alternatives from left to right, which keeps
+    Django's first-match-wins ordering.
+
+    The winning child is returned along with all the children after it. The
+    child's own ``resolve`` extracts its groups, and if it turns out not to
+    match (an included URLconf with nothing matching the rest of the path)
+    the children after it are tried in turn.
+
+    This only works if every child is anchored at the start of the path, so
+    the index falls back to trying every child if any of them isn't (including
+    those with a ``|`` outside of any group), or if any of them can't be
+    combined with the others.
+    """
+    # Python's re module can't handle more than 100 groups per regex.
+    chunk_size = 90
+
+    def __init__(self, regexes):
+        self._count = len(regexes)
+        alternatives = []
+        for regex in regexes:
+            if not regex.startswith('^') or has_top_level_alternation(regex):
+                alternatives = None
+                break
+            alternative = make_groups_non_capturing(regex)
+            if alternative is None:
+                alternatives = None
+                break
+            alternatives.append(alternative)
+
+        self._chunks = None
+        if alternatives is not None:
+            try:
+                self._chunks = [
+                    (offset, re.compile(u'|'.join([
+                        u'(?P<_%d>%s)' % (i, alternative) for (i, alternative)
+                        in enumerate(alternatives[offset:offset + self.chunk_size])
+                    ]), re.UNICODE))
+                    for offset in range(0, len(alternatives), self.chunk_size)
+                ]
+            except re.error:
+                self._chunks = None
+
+    def candidates(self, path):
+        if self._chunks is None:
+            return xrange(self._count)
+        for offset, combined_regex in self._chunks:
+            match = combined_regex.match(path)
+            if match:
+                return xrange(offset + match.lastindex - 1, self._count)
+        return ()
+
+
+RESOLVE_INDEXES = {
+    'prefix': PrefixIndex,
+    'alternation': AlternationIndex,
+}
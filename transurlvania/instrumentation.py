@@ -0,0 +1,152 @@
+"""
+Counts and times the work transurlvania does to translate URLs, for finding
+out which languages and views are behind slow requests.
+
+Instrumentation is off unless MULTILANG_INSTRUMENTATION is set (or ``enable``
+is called), and the code being measured only checks the ``enabled`` flag
+while it's off. When it's on, each event is:
+
+* added to the totals returned by ``get_stats``,
+* sent with the ``url_translation_event`` signal,
+* passed to the stats backend: the callable named by MULTILANG_STATS_BACKEND
+  or given to ``enable``, which is called with the same arguments as the
+  signal's receivers, minus ``sender``.
+
+Events, and the keys they're recorded under:
+
+* 'regex compile': a translated URL regex was compiled. The key is the
+  language.
+* 'gettext lookup': a URL regex was looked up in a gettext catalog. The key is
+  the language.
+* 'reverse dict build': a resolver's reverse dict was built, including those
+  of the URLconfs it includes. The key is ``(urlconf, lang)``.
+* 'reverse': ``reverse_for_language`` looked for a URL. The key is
+  ``(view, lang)`` and ``candidates`` gives the number of URL templates tried.
+* 'reverse cache hit': ``reverse_for_language`` found the URL in its cache.
+  The key is ``(view, lang)``.
+* 'scheme fallback': AutodetectScheme moved on to its next way of finding a
+  URL. The key is ``('object', 'view')`` or ``('view', 'current url')``.
+* 'scheme result': AutodetectScheme found URLs with one of the schemes it
+  tries. The key is that scheme's class name and ``languages`` lists the
+  languages it found URLs for.
+* 'translation lookup': ObjectBasedScheme called an object's
+  ``get_translation`` or ``get_translations`` method. The key is the method's
+  name and ``languages`` lists the languages asked for.
+* 'scheme lookup': a URLTranslator asked its scheme for URLs. The key is the
+  scheme's class name and ``languages`` lists the languages asked for. It's
+  recorded after the scheme's own events.
+"""
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.dispatch import Signal
+from django.utils.importlib import import_module
+
+import transurlvania.settings
+
+
+url_translation_event = Signal(providing_args=['event', 'key', 'seconds', 'info'])
+
+enabled = bool(transurlvania.settings.INSTRUMENTATION)
+
+# Maps (event, key) pairs onto [count, total seconds] lists.
+_stats = {}
+_lock = threading.Lock()
+
+# The stats backend, once loaded. NOT_LOADED until then.
+NOT_LOADED = object()
+_backend = NOT_LOADED
+
+
+def load_backend(path):
+    try:
+        dot = path.rindex('.')
+    except ValueError:
+        raise ImproperlyConfigured('%s isn\'t a stats backend.' % path)
+    module_name, attr = path[:dot], path[dot + 1:]
+    try:
+        return getattr(import_module(module_name), attr)
+    except (ImportError, AttributeError), e:
+        raise ImproperlyConfigured('Error importing stats backend %s: "%s"' % (path, e))
+
+
+def get_backend():
+    global _backend
+    if _backend is NOT_LOADED:
+        if transurlvania.settings.STATS_BACKEND:
+            _backend = load_backend(transurlvania.settings.STATS_BACKEND)
+        else:
+            _backend = None
+    return _backend
+
+
+def enable(backend=None):
+    """
+    Turns instrumentation on, optionally with ``backend`` as the stats
+    backend instead of the one named by MULTILANG_STATS_BACKEND.
+    """
+    global enabled, _backend
+    if backend is not None:
+        _backend = backend
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def record(event, key=None, seconds=0.0, **info):
+    _lock.acquire()
+    try:
+        totals = _stats.get((event, key))
+        if totals is None:
+            totals = _stats[(event, key)] = [0, 0.0]
+        totals[0] += 1
+        totals[1] += seconds
+    finally:
+        _lock.release()
+    url_translation_event.send(sender=None, event=event, key=key, seconds=seconds, info=info)
+    backend = get_backend()
+    if backend is not None:
+        backend(event=event, key=key, seconds=seconds, info=info)
+
+
+def get_stats():
+    """
+    Returns a dict mapping ``(event, key)`` pairs onto ``(count, seconds)``
+    pairs giving the number of times each event was recorded and the total
+    time it took.
+    """
+    _lock.acquire()
+    try:
+        return dict([(event_key, tuple(totals)) for (event_key, totals) in _stats.items()])
+    finally:
+        _lock.release()
+
+
+def reset_stats():
+    _lock.acquire()
+    try:
+        _stats.clear()
+    finally:
+        _lock.release()
+
+
+def get_view_label(view):
+    """
+    Returns a string naming a view given as a callable or a name.
+    """
+    if isinstance(view, basestring):
+        return view
+    module = getattr(view, '__module__', None)
+    name = getattr(view, '__name__', None)
+    if module is not None and name is not None:
+        return '%s.%s' % (module, name)
+    return repr(view)
+
+
+def get_urlconf_label(urlconf_name):
+    if isinstance(urlconf_name, basestring):
+        return urlconf_name
+    return repr(urlconf_name)
@@ -0,0 +1,128 @@
+import threading
+
+
+# Indexes into the links of the doubly linked list that orders the items.
+PREV, NEXT, KEY, VALUE = 0, 1, 2, 3
+
+
+class LRUCache(object):
+    """
+    Mapping that holds at most ``maxsize`` items and discards the least
+    recently used one to make room for a new one. It's safe to share between
+    threads, and counts the hits and misses of ``get``.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._links = {}
+        # The root of the circular list. The link after it is the least
+        # recently used, the link before it the most recently used.
+        root = []
+        root[:] = [root, root, None, None]
+        self._root = root
+
+    def _unlink(self, link):
+        link[PREV][NEXT] = link[NEXT]
+        link[NEXT][PREV] = link[PREV]
+
+    def _append(self, link):
+        root = self._root
+        last = root[PREV]
+        link[PREV] = last
+        link[NEXT] = root
+        last[NEXT] = root[PREV] = link
+
+    def get(self, key, default=None):
+        self._lock.acquire()
+        try:
+            link = self._links.get(key)
+            if link is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._unlink(link)
+            self._append(link)
+            return link[VALUE]
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._lock.acquire()
+        try:
+            link = self._links.get(key)
+            if link is not None:
+                self._unlink(link)
+                link[VALUE] = value
+            else:
+                if len(self._links) >= self.maxsize:
+                    oldest = self._root[NEXT]
+                    self._unlink(oldest)
+                    del self._links[oldest[KEY]]
+                link = [None, None, key, value]
+                self._links[key] = link
+            self._append(link)
+        finally:
+            self._lock.release()
+
+    def discard(self, key):
+        self._lock.acquire()
+        try:
+            link = self._links.pop(key, None)
+            if link is not None:
+                self._unlink(link)
+        finally:
+            self._lock.release()
+
+    def discard_where(self, test):
+        """
+        Discards every item whose key passes ``test``.
+        """
+        self._lock.acquire()
+        try:
+            for key in [key for key in self._links if test(key)]:
+                self._unlink(self._links.pop(key))
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._reset()
+        finally:
+            self._lock.release()
+
+    def keys(self):
+        """
+        Returns the keys from least to most recently used.
+        """
+        self._lock.acquire()
+        try:
+            keys = []
+            link = self._root[NEXT]
+            while link is not self._root:
+                keys.append(link[KEY])
+                link = link[NEXT]
+            return keys
+        finally:
+            self._lock.release()
+
+    def __contains__(self, key):
+        return key in self._links
+
+    def __len__(self):
+        return len(self._links)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._links),
+            'maxsize': self.maxsize,
+        }
@@ -0,0 +1,26 @@
+from optparse import make_option
+
+from django.core.management.base import LabelCommand
+
+from transurlvania.routing_table import write_routing_table
+
+
+class Command(LabelCommand):
+    option_list = LabelCommand.option_list + (
+        make_option('--urlconf', dest='urlconf', default=None,
+            help='The URLconf module to compile. Defaults to ROOT_URLCONF.'),
+        make_option('--languages', dest='languages', default=None,
+            help='Comma-separated list of language codes. Defaults to all of LANGUAGES.'),
+    )
+    help = ("Writes the translated routing table for each language to a file "
+            "that can be loaded with the MULTILANG_ROUTING_TABLE setting.")
+    args = '<output file>'
+    label = 'output file'
+
+    def handle_label(self, path, **options):
+        languages = options.get('languages')
+        if languages:
+            languages = languages.split(',')
+        table = write_routing_table(path, options.get('urlconf'), languages)
+        return 'Wrote routing table for %s in %s to %s' % (
+            table['urlconf'], ', '.join(sorted(table['languages'].keys())), path)
@@ -0,0 +1,25 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from transurlvania.warmup import warm_up
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        make_option('--urlconf', dest='urlconf', default=None,
+            help='The URLconf module to warm up. Defaults to ROOT_URLCONF.'),
+        make_option('--languages', dest='languages', default=None,
+            help='Comma-separated list of language codes. Defaults to all of LANGUAGES.'),
+    )
+    help = ("Loads the gettext catalogs and builds the translated URL resolvers "
+            "for each language, and reports how long each stage took.")
+
+    def handle_noargs(self, **options):
+        languages = options.get('languages')
+        if languages:
+            languages = languages.split(',')
+        timings = warm_up(options.get('urlconf'), languages)
+        lines = ['%s: %.3fs' % (stage, seconds) for (stage, seconds) in timings]
+        lines.append('total: %.3fs' % sum([seconds for (stage, seconds) in timings]))
+        return '\n'.join(lines)
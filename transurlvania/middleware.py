@@ -1,9 +1,18 @@
+import threading
+import time
+
 from django.conf import settings
 from django.core import urlresolvers
+from django.core.exceptions import MiddlewareNotUsed
 from django.utils import translation
 
-from transurlvania.settings import LANGUAGE_DOMAINS
-from transurlvania.translators import URLTranslator, AutodetectScheme
+from transurlvania.settings import CACHE_RESOLVERS, LANGUAGE_DOMAINS
+from transurlvania.settings import LANGUAGE_DOMAIN_ALIASES
+from transurlvania.settings import URL_TRANSLATION_EXCLUDED_PATHS
+from transurlvania.settings import URL_TRANSLATION_REPORT
+from transurlvania import instrumentation
+from transurlvania.translators import LazyURLTranslator, AutodetectScheme
+from transurlvania.urlresolvers import split_lang_prefix
 
 
 class LangInPathMiddleware(object):
@@ -16,7 +25,7 @@ class LangInPathMiddleware(object):
         self.lang_codes = set(dict(settings.LANGUAGES).keys())
 
     def process_request(self, request):
-        potential_lang_code = request.path_info.lstrip('/').split('/', 1)[0]
+        potential_lang_code = split_lang_prefix(request.path_info.lstrip('/'))[0]
         if potential_lang_code in self.lang_codes:
             translation.activate(potential_lang_code)
             request.LANGUAGE_CODE = translation.get_language()
@@ -28,22 +37,94 @@ class LangInDomainMiddleware(object):
     the request.
     This needs to be installed after the LocaleMiddleware so it can override
     that middleware's decisions.
+
+    Besides the domain in MULTILANG_LANGUAGE_DOMAINS, each language can have
+    extra hosts listed in MULTILANG_LANGUAGE_DOMAIN_ALIASES. A host can
+    include a port, in which case it only matches requests on that port, or
+    start with "*." to match any subdomain.
     """
+    # Hosts come from the request, so the cache of matches is capped to keep
+    # bogus Host headers from growing it forever.
+    max_cached_hosts = 1000
+
+    def __init__(self):
+        self.host_langs = {}
+        self.wildcard_langs = {}
+        langs = set(LANGUAGE_DOMAINS.keys()) | set(LANGUAGE_DOMAIN_ALIASES.keys())
+        for lang in langs:
+            hosts = list(LANGUAGE_DOMAIN_ALIASES.get(lang, ()))
+            if lang in LANGUAGE_DOMAINS:
+                hosts.insert(0, LANGUAGE_DOMAINS[lang][0])
+            for host in hosts:
+                host = host.lower()
+                if host.startswith('*.'):
+                    self.wildcard_langs.setdefault(host[1:], lang)
+                else:
+                    self.host_langs.setdefault(host, lang)
+        self.matched_hosts = {}
+
+    def get_lang_for_host(self, host):
+        try:
+            return self.matched_hosts[host]
+        except KeyError:
+            pass
+        lang = self.find_lang_for_host(host.lower())
+        if len(self.matched_hosts) >= self.max_cached_hosts:
+            self.matched_hosts.clear()
+        self.matched_hosts[host] = lang
+        return lang
+
+    def find_lang_for_host(self, host):
+        if host in self.host_langs:
+            return self.host_langs[host]
+        host = host.split(':', 1)[0]
+        if host in self.host_langs:
+            return self.host_langs[host]
+        # Try the longest wildcard suffix first.
+        dot = host.find('.')
+        while dot != -1:
+            lang = self.wildcard_langs.get(host[dot:])
+            if lang:
+                return lang
+            dot = host.find('.', dot + 1)
+        return None
 
     def process_request(self, request):
-        for lang in LANGUAGE_DOMAINS.keys():
-            if LANGUAGE_DOMAINS[lang][0] == request.META['SERVER_NAME']:
-                translation.activate(lang)
-                request.LANGUAGE_CODE = translation.get_language()
+        for key in ('SERVER_NAME', 'HTTP_HOST'):
+            host = request.META.get(key)
+            if host:
+                lang = self.get_lang_for_host(host)
+                if lang:
+                    translation.activate(lang)
+                    request.LANGUAGE_CODE = translation.get_language()
+                    return
 
 
 class URLTransMiddleware(object):
+    """
+    Middleware that gives each request a URL translator for finding the
+    current page's URL in other languages.
+
+    The translator is only actually created when something uses it. Requests
+    whose path starts with one of the prefixes in
+    MULTILANG_URL_TRANSLATION_EXCLUDED_PATHS don't get one at all.
+    """
+    def __init__(self):
+        self.excluded_paths = tuple(URL_TRANSLATION_EXCLUDED_PATHS)
+        # Schemes don't hold any per-request state, so one will do for all
+        # requests.
+        self.scheme = AutodetectScheme()
+
     def process_request(self, request):
-        request.url_translator = URLTranslator(request.build_absolute_uri())
+        if self.excluded_paths and request.path_info.startswith(self.excluded_paths):
+            return None
+        request.url_translator = LazyURLTranslator(request)
 
     def process_view(self, request, view_func, view_args, view_kwargs):
-        request.url_translator.set_view_info(view_func, view_args, view_kwargs)
-        request.url_translator.scheme = AutodetectScheme()
+        url_translator = getattr(request, 'url_translator', None)
+        if url_translator is not None:
+            url_translator.set_view_info(view_func, view_args, view_kwargs)
+            url_translator.scheme = self.scheme
         return None
 
 
@@ -74,8 +155,125 @@ class URLCacheResetMiddleware(object):
     are locked into one language, and the next request might be in a different
     language.
 
-    This middleware is required if the project uses translated URLs.
+    This middleware is only required if the project uses translated URLs and
+    has turned off the language-keyed resolver cache by setting
+    MULTILANG_CACHE_RESOLVERS to False. Otherwise it takes itself out of the
+    middleware stack.
     """
+    def __init__(self):
+        if CACHE_RESOLVERS:
+            raise MiddlewareNotUsed
+
     def process_response(self, request, response):
         urlresolvers.clear_url_caches()
         return response
+
+
+# The events recorded so far for the request being handled by the current
+# thread, if it's getting a URL translation report.
+_report_state = threading.local()
+
+
+def collect_url_translation_event(sender, event, key, seconds, info, **kwargs):
+    events = getattr(_report_state, 'events', None)
+    if events is not None:
+        events.append((event, key, seconds, info))
+
+
+def format_seconds(seconds):
+    return '%.1fms' % (seconds * 1000)
+
+
+class URLTranslationReportMiddleware(object):
+    """
+    Middleware that adds a summary of the URL translation work done for a
+    request to the response: the reversals, the scheme that found the URL
+    for each language and the translation lookups it did, and the regexes and
+    reverse dicts that had to be built. The summary goes in the
+    X-URL-Translation-Report header, and in an HTML comment at the end of
+    HTML pages.
+
+    Every response gets a report when DEBUG is on. Otherwise, if
+    MULTILANG_URL_TRANSLATION_REPORT is set, requests can ask for one by
+    sending the X-URL-Translation-Report header. The middleware turns
+    instrumentation on (see ``transurlvania.instrumentation``), so it's best
+    installed only while looking into slow pages.
+    """
+    request_header = 'HTTP_X_URL_TRANSLATION_REPORT'
+    response_header = 'X-URL-Translation-Report'
+
+    def __init__(self):
+        if not (settings.DEBUG or URL_TRANSLATION_REPORT):
+            raise MiddlewareNotUsed
+        instrumentation.enable()
+        instrumentation.url_translation_event.connect(collect_url_translation_event,
+            dispatch_uid='transurlvania.middleware.URLTranslationReportMiddleware')
+
+    def process_request(self, request):
+        if settings.DEBUG or self.request_header in request.META:
+            _report_state.events = []
+            _report_state.start = time.time()
+        else:
+            _report_state.events = None
+
+    def process_response(self, request, response):
+        events = getattr(_report_state, 'events', None)
+        if events is None:
+            return response
+        _report_state.events = None
+        lines = self.get_summary(events, time.time() - _report_state.start)
+        response[self.response_header] = '; '.join(lines)
+        if 'text/html' in response.get('Content-Type', ''):
+            comment = '\n'.join(lines).replace('--', '- -')
+            response.content += '\n<!-- URL translation report:\n%s\n-->\n' % comment
+        return response
+
+    def get_summary(self, events, request_seconds):
+        """
+        Returns the lines of the report for a request's events.
+        """
+        reversals = candidates = cache_hits = 0
+        reverse_seconds = 0.0
+        totals = {}
+        lines = []
+        # The scheme that found each language's URL, and the translation
+        # lookups done, since the last scheme lookup.
+        results = {}
+        translation_lookups = 0
+        for event, key, seconds, info in events:
+            if event == 'reverse':
+                reversals += 1
+                candidates += info['candidates']
+                reverse_seconds += seconds
+            elif event == 'reverse cache hit':
+                cache_hits += 1
+            elif event == 'scheme result':
+                for lang in info['languages']:
+                    results[lang] = key
+            elif event == 'translation lookup':
+                translation_lookups += 1
+            elif event == 'scheme lookup':
+                line = '%s for %s: %s, %d translation lookups' % (
+                    key, ','.join(info['languages']), format_seconds(seconds),
+                    translation_lookups)
+                found = ['%s from %s' % (lang, results[lang])
+                         for lang in info['languages'] if lang in results]
+                if found:
+                    line += ' (%s)' % ', '.join(found)
+                lines.append(line)
+                results = {}
+                translation_lookups = 0
+            elif event == 'scheme fallback':
+                lines.append('fallback from %s to %s for %s' % (key[0], key[1],
+                                                                ','.join(info['languages'])))
+            else:
+                count, total = totals.get(event, (0, 0.0))
+                totals[event] = (count + 1, total + seconds)
+        lines.insert(0, 'reverse: %d calls, %d candidates, %d cached, %s'
+                        % (reversals, candidates, cache_hits, format_seconds(reverse_seconds)))
+        for event in ('regex compile', 'gettext lookup', 'reverse dict build'):
+            if event in totals:
+                count, total = totals[event]
+                lines.append('%s: %d, %s' % (event, count, format_seconds(total)))
+        lines.append('request: %s' % format_seconds(request_seconds))
+        return lines
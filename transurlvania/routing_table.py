@@ -0,0 +1,246 @@
+"""
+Routing tables hold everything transurlvania works out from a URLconf for each
+language: the translated regex of each pattern, and the reverse, namespace and
+app dicts of each resolver. Building one ahead of time (with the
+``compileurls`` management command) and pointing MULTILANG_ROUTING_TABLE at it
+lets processes start without going through gettext and ``normalize`` for every
+pattern.
+
+Tables are written with ``marshal``, so they have to be built with the same
+version of Python that will load them. A table that doesn't match the current
+URLconf, or whose translations came from gettext catalogs that have changed
+since, is ignored.
+"""
+import gettext
+import marshal
+import os
+import re
+import sys
+import warnings
+
+from django.conf import settings
+from django.core.urlresolvers import RegexURLResolver
+from django.utils.datastructures import MultiValueDict
+from django.utils.importlib import import_module
+from django.utils.translation import to_locale
+
+from transurlvania.urlresolvers import MultilangRegexURLResolver
+from transurlvania.urlresolvers import get_languages, iter_url_patterns
+import transurlvania.settings
+
+
+TABLE_VERSION = 2
+
+# Position standing for the root resolver of the URLconf.
+ROOT = -1
+
+# Kinds of reverse dict keys.
+CALLBACK = 0
+NAME = 1
+
+
+def get_url_patterns(urlconf):
+    return list(iter_url_patterns(MultilangRegexURLResolver(r'^/', urlconf).url_patterns))
+
+
+def get_pattern_signature(pattern):
+    if hasattr(pattern, '_raw_regex'):
+        regex = pattern._raw_regex
+    elif hasattr(pattern, 'get_regex'):
+        regex = None
+    else:
+        regex = pattern.regex.pattern
+    return (pattern.__class__.__name__, regex, getattr(pattern, 'name', None))
+
+
+def get_locale_paths():
+    """
+    Returns the directories Django loads gettext catalogs from, as
+    ``django.utils.translation.trans_real.translation`` looks them up.
+    """
+    paths = [os.path.join(os.path.dirname(sys.modules[settings.__module__].__file__), 'locale')]
+    paths.extend(settings.LOCALE_PATHS)
+    for appname in settings.INSTALLED_APPS:
+        app = import_module(appname)
+        paths.append(os.path.join(os.path.dirname(app.__file__), 'locale'))
+    if settings.SETTINGS_MODULE is not None:
+        project = import_module(settings.SETTINGS_MODULE.split('.')[0])
+        paths.append(os.path.join(os.path.dirname(project.__file__), 'locale'))
+    return [path for path in paths if os.path.isdir(path)]
+
+
+def get_catalog_fingerprint(languages):
+    """
+    Returns the path, modification time and size of every gettext catalog
+    that the translations of ``languages`` (and of settings.LANGUAGE_CODE,
+    which they fall back to) come from.
+    """
+    locales = [to_locale(lang) for lang in list(languages) + [settings.LANGUAGE_CODE]]
+    fingerprint = set()
+    for path in get_locale_paths():
+        for mo_file in gettext.find('django', path, locales, all=True):
+            stat = os.stat(mo_file)
+            fingerprint.add((mo_file, stat.st_mtime, stat.st_size))
+    return sorted(fingerprint)
+
+
+def dump_resolver(resolver, lang, resolver_positions, callback_positions):
+    reverse_dict = resolver.get_reverse_dict(lang)
+    entries = []
+    for key in reverse_dict:
+        if callable(key):
+            key_ref = (CALLBACK, callback_positions[key])
+        else:
+            key_ref = (NAME, key)
+        entries.append((key_ref, reverse_dict.getlist(key)))
+    namespaces = dict([
+        (namespace, (prefix, resolver_positions[id(sub_resolver)]))
+        for (namespace, (prefix, sub_resolver))
+        in resolver.get_namespace_dict(lang).items()
+    ])
+    return (entries, namespaces, resolver.get_app_dict(lang))
+
+
+def load_resolver(resolver, lang, dumped, url_patterns):
+    if lang in resolver._lang_reverse_dicts:
+        return
+    entries, namespaces, apps = dumped
+    reverse_dict = MultiValueDict()
+    for (kind, value), possibilities in entries:
+        if kind == CALLBACK:
+            key = url_patterns[value].callback
+        else:
+            key = value
+        reverse_dict.setlist(key, possibilities)
+    resolver._lang_namespace_dicts[lang] = dict([
+        (namespace, (prefix, url_patterns[position]))
+        for (namespace, (prefix, position)) in namespaces.items()
+    ])
+    resolver._lang_app_dicts[lang] = apps
+    resolver._lang_reverse_dicts[lang] = reverse_dict
+
+
+def build_routing_table(urlconf=None, languages=None):
+    """
+    Returns the routing table for the URLconf in each of ``languages`` (all of
+    settings.LANGUAGES by default).
+    """
+    if urlconf is None:
+        urlconf = settings.ROOT_URLCONF
+    languages = languages or get_languages()
+    url_patterns = get_url_patterns(urlconf)
+
+    resolver_positions = {}
+    callback_positions = {}
+    for position, pattern in enumerate(url_patterns):
+        if isinstance(pattern, RegexURLResolver):
+            resolver_positions.setdefault(id(pattern), position)
+        else:
+            callback_positions.setdefault(pattern.callback, position)
+
+    language_tables = {}
+    for lang in languages:
+        root = MultilangRegexURLResolver(r'^/', urlconf)
+        regexes = []
+        resolvers = {ROOT: dump_resolver(root, lang, resolver_positions, callback_positions)}
+        for position, pattern in enumerate(url_patterns):
+            if hasattr(pattern, '_raw_regex'):
+                regexes.append((position, pattern.get_regex(lang).pattern))
+            if hasattr(pattern, 'get_reverse_dict'):
+                resolvers[position] = dump_resolver(pattern, lang,
+                    resolver_positions, callback_positions)
+        language_tables[lang] = {'regexes': regexes, 'resolvers': resolvers}
+
+    return {
+        'version': TABLE_VERSION,
+        'urlconf': urlconf,
+        'signatures': [get_pattern_signature(pattern) for pattern in url_patterns],
+        'catalogs': get_catalog_fingerprint(languages),
+        'languages': language_tables,
+    }
+
+
+def write_routing_table(path, urlconf=None, languages=None):
+    table = build_routing_table(urlconf, languages)
+    f = open(path, 'wb')
+    try:
+        marshal.dump(table, f)
+    finally:
+        f.close()
+    return table
+
+
+# Maps URLconfs onto the loaded root resolver entries for each language, and
+# the URLconf's patterns.
+_root_entries = {}
+def load_routing_table(path, urlconf=None):
+    """
+    Fills in the regexes, reverse dicts, namespace dicts and app dicts of the
+    patterns in the URLconf from the routing table stored at ``path``. Returns
+    False, without changing anything, if the table doesn't match the URLconf
+    or the gettext catalogs have changed since it was built.
+    """
+    if urlconf is None:
+        urlconf = settings.ROOT_URLCONF
+    f = open(path, 'rb')
+    try:
+        table = marshal.load(f)
+    finally:
+        f.close()
+    if table.get('version') != TABLE_VERSION or table.get('urlconf') != urlconf:
+        return False
+    url_patterns = get_url_patterns(urlconf)
+    if table['signatures'] != [get_pattern_signature(pattern) for pattern in url_patterns]:
+        return False
+    if table['catalogs'] != get_catalog_fingerprint(table['languages'].keys()):
+        return False
+
+    roots = {}
+    for lang, language_table in table['languages'].items():
+        for position, regex in language_table['regexes']:
+            pattern = url_patterns[position]
+            if lang not in pattern._regex_dict:
+                pattern.set_regex(lang, re.compile(regex, re.UNICODE))
+        for position, dumped in language_table['resolvers'].items():
+            if position == ROOT:
+                roots[lang] = dumped
+            else:
+                load_resolver(url_patterns[position], lang, dumped, url_patterns)
+    _root_entries[urlconf] = (roots, url_patterns)
+    return True
+
+
+def load_root_resolver(resolver, urlconf, lang):
+    """
+    Fills in a root resolver for the URLconf from its loaded routing table, if
+    there is one.
+    """
+    try:
+        roots, url_patterns = _root_entries[urlconf]
+    except KeyError:
+        return
+    if lang in roots:
+        load_resolver(resolver, lang, roots[lang], url_patterns)
+
+
+_configured_urlconfs = set()
+def load_configured_routing_table(urlconf):
+    """
+    Loads the routing table named by MULTILANG_ROUTING_TABLE for the URLconf,
+    the first time it's called for that URLconf, and returns True if it was
+    the first time. Tables that can't be read or don't match the URLconf and
+    its translations are skipped with a warning.
+    """
+    if urlconf in _configured_urlconfs:
+        return False
+    _configured_urlconfs.add(urlconf)
+    path = transurlvania.settings.ROUTING_TABLE
+    try:
+        loaded = load_routing_table(path, urlconf)
+    except (IOError, EOFError, ValueError, TypeError), e:
+        warnings.warn('Unable to read routing table %s: %s' % (path, e))
+        return True
+    if not loaded:
+        warnings.warn('Routing table %s does not match URLconf %s or its '
+                      'translations and was not used.' % (path, urlconf))
+    return True
@@ -5,3 +5,48 @@ HIDE_TRANSLATABLE_APPS = getattr(settings, "MULTILANG_HIDE_TRANSLATABLE_APPS", F
 
 
 LANGUAGE_DOMAINS = getattr(settings, "MULTILANG_LANGUAGE_DOMAINS", {})
+
+
+CACHE_RESOLVERS = getattr(settings, "MULTILANG_CACHE_RESOLVERS", True)
+
+
+PRECOMPILE_URLS = getattr(settings, "MULTILANG_PRECOMPILE_URLS", False)
+
+
+RESOLVE_ENGINE = getattr(settings, "MULTILANG_RESOLVE_ENGINE", 'sequential')
+
+
+LANGUAGE_DOMAIN_ALIASES = getattr(settings, "MULTILANG_LANGUAGE_DOMAIN_ALIASES", {})
+
+
+REVERSE_CACHE_SIZE = getattr(settings, "MULTILANG_REVERSE_CACHE_SIZE", 0)
+
+
+RESOLVER_CACHE_SIZE = getattr(settings, "MULTILANG_RESOLVER_CACHE_SIZE", None)
+
+
+URL_TRANSLATION_EXCLUDED_PATHS = getattr(settings, "MULTILANG_URL_TRANSLATION_EXCLUDED_PATHS", ())
+
+
+ROUTING_TABLE = getattr(settings, "MULTILANG_ROUTING_TABLE", None)
+
+
+COMPACT_PATTERNS = getattr(settings, "MULTILANG_COMPACT_PATTERNS", False)
+
+
+DIRECT_LANGUAGE_DISPATCH = getattr(settings, "MULTILANG_DIRECT_LANGUAGE_DISPATCH", False)
+
+
+RESOLVE_CACHE_SIZE = getattr(settings, "MULTILANG_RESOLVE_CACHE_SIZE", 0)
+
+
+RESOLVE_404_CACHE_SIZE = getattr(settings, "MULTILANG_RESOLVE_404_CACHE_SIZE", 0)
+
+
+INSTRUMENTATION = getattr(settings, "MULTILANG_INSTRUMENTATION", False)
+
+
+STATS_BACKEND = getattr(settings, "MULTILANG_STATS_BACKEND", None)
+
+
+URL_TRANSLATION_REPORT = getattr(settings, "MULTILANG_URL_TRANSLATION_REPORT", False)
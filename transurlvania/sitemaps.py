@@ -0,0 +1,213 @@
+"""
+Sitemaps listing each page in every language it's available in, with
+``xhtml:link`` alternates pointing at its other languages.
+
+Unlike Django's sitemaps framework, each page's URLs are worked out once for
+all languages instead of once for every entry that mentions them, and the
+XML is generated as it's sent: items are fetched ``chunk_size`` at a time and
+never all held in memory.
+
+Sitemaps are split into pages of at most MAX_ENTRIES ``<url>`` entries, which
+are listed by the sitemap index.
+"""
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils.encoding import smart_str
+from django.utils.html import escape
+
+from transurlvania.urlresolvers import get_languages, reverse_for_language
+
+
+# The most URLs a sitemap file may list, according to sitemaps.org.
+MAX_ENTRIES = 50000
+
+SITEMAP_HEADER = (
+    u'<?xml version="1.0" encoding="UTF-8"?>\n'
+    u'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" '
+    u'xmlns:xhtml="http://www.w3.org/1999/xhtml">\n'
+)
+SITEMAP_FOOTER = u'</urlset>\n'
+
+INDEX_HEADER = (
+    u'<?xml version="1.0" encoding="UTF-8"?>\n'
+    u'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+)
+INDEX_FOOTER = u'</sitemapindex>\n'
+
+
+class MultilangSitemap(object):
+    """
+    Base class for sitemaps. Subclasses define ``items``, and ``get_urls`` if
+    the items don't have ``get_translations`` or ``get_translation`` methods
+    (see ObjectBasedScheme). ``lastmod``, ``changefreq`` and ``priority``
+    work as they do for Django's sitemaps, and can be attributes or methods
+    taking the item.
+
+    ``items`` can return anything that can be sliced and counted, like a
+    QuerySet. QuerySets should be ordered so that the chunks they're fetched
+    in don't overlap.
+    """
+    # The languages to list URLs in. All of settings.LANGUAGES by default.
+    languages = None
+    # The number of items fetched at a time.
+    chunk_size = 500
+
+    def items(self):
+        return []
+
+    def get_languages(self):
+        return self.languages or get_languages()
+
+    def get_urls(self, item, languages):
+        """
+        Returns a dict mapping each of ``languages`` that ``item`` is available
+        in onto its URL in that language. Missing translations are left out
+        rather than cutting short a sitemap that's already being sent.
+        """
+        urls = {}
+        if hasattr(item, 'get_translations'):
+            try:
+                translations = item.get_translations(languages)
+            except ObjectDoesNotExist:
+                return urls
+            for lang in languages:
+                if lang in translations:
+                    try:
+                        urls[lang] = translations[lang].get_absolute_url()
+                    except (AttributeError, ObjectDoesNotExist):
+                        pass
+            return urls
+        for lang in languages:
+            try:
+                urls[lang] = item.get_translation(lang).get_absolute_url()
+            except (AttributeError, ObjectDoesNotExist):
+                pass
+        return urls
+
+    def get_chunk_urls(self, chunk, languages):
+        """
+        Returns the URLs of each item in ``chunk``, as returned by
+        ``get_urls``. Can be overridden to work them out for the whole chunk
+        at once (see ``transurlvania.utils.get_absolute_urls``).
+        """
+        return [self.get_urls(item, languages) for item in chunk]
+
+    def get_items_per_page(self):
+        # Each item can have an entry in every language.
+        return max(MAX_ENTRIES / len(self.get_languages()), 1)
+
+    def get_num_pages(self, items=None):
+        if items is None:
+            items = self.items()
+        try:
+            count = items.count()
+        except (AttributeError, TypeError):
+            # Lists have a count method too, but it needs an argument.
+            count = len(items)
+        per_page = self.get_items_per_page()
+        return max((count + per_page - 1) / per_page, 1)
+
+    def _get(self, name, item):
+        attr = getattr(self, name, None)
+        if callable(attr):
+            return attr(item)
+        return attr
+
+    def iter_chunks(self, page=1):
+        """
+        Yields the items on ``page`` (counting from 1), ``chunk_size`` at a
+        time.
+        """
+        items = self.items()
+        per_page = self.get_items_per_page()
+        start = (page - 1) * per_page
+        stop = start + per_page
+        for offset in xrange(start, stop, self.chunk_size):
+            chunk = list(items[offset:min(offset + self.chunk_size, stop)])
+            if not chunk:
+                break
+            yield chunk
+
+    def iter_entries(self, page=1):
+        """
+        Yields an ``(item, lang, url, urls)`` tuple for each URL on ``page``,
+        where ``urls`` maps every language the item is available in onto its
+        URL in that language.
+        """
+        languages = self.get_languages()
+        for chunk in self.iter_chunks(page):
+            for item, urls in zip(chunk, self.get_chunk_urls(chunk, languages)):
+                for lang in languages:
+                    if lang in urls:
+                        yield item, lang, urls[lang], urls
+
+
+class ViewSitemap(MultilangSitemap):
+    """
+    Sitemap of views that don't take any arguments, given by name (or as
+    functions), in every language.
+    """
+    def __init__(self, views, languages=None):
+        self.views = views
+        if languages is not None:
+            self.languages = languages
+
+    def items(self):
+        return self.views
+
+    def get_urls(self, view, languages):
+        return dict([(lang, reverse_for_language(view, lang)) for lang in languages])
+
+
+def complete_sitemap_url(url, protocol, domain):
+    """
+    Adds the protocol and domain to URLs that don't already have them (as
+    URLs for languages in LANGUAGE_DOMAINS do).
+    """
+    if url.startswith('http://') or url.startswith('https://'):
+        return url
+    return u'%s://%s%s' % (protocol, domain, url)
+
+
+def get_url_entry(sitemap, item, url, urls, languages, protocol, domain):
+    lines = [u'<url>', u'<loc>%s</loc>' % escape(complete_sitemap_url(url, protocol, domain))]
+    for lang in languages:
+        if lang in urls:
+            lines.append(u'<xhtml:link rel="alternate" hreflang="%s" href="%s"/>' % (
+                escape(lang), escape(complete_sitemap_url(urls[lang], protocol, domain))))
+    lastmod = sitemap._get('lastmod', item)
+    if lastmod is not None:
+        lines.append(u'<lastmod>%s</lastmod>' % lastmod.strftime('%Y-%m-%d'))
+    changefreq = sitemap._get('changefreq', item)
+    if changefreq is not None:
+        lines.append(u'<changefreq>%s</changefreq>' % escape(changefreq))
+    priority = sitemap._get('priority', item)
+    if priority is not None:
+        lines.append(u'<priority>%s</priority>' % escape(priority))
+    lines.append(u'</url>\n')
+    return u''.join(lines)
+
+
+def iter_sitemap_xml(sitemaps, page=1, protocol='http', domain=''):
+    """
+    Yields the XML of the sitemap listing ``page`` of each of ``sitemaps`` as
+    UTF-8 encoded strings, one ``<url>`` entry at a time. ``protocol`` and
+    ``domain`` are added to URLs without them.
+    """
+    yield smart_str(SITEMAP_HEADER)
+    for sitemap in sitemaps:
+        languages = sitemap.get_languages()
+        for item, lang, url, urls in sitemap.iter_entries(page):
+            yield smart_str(get_url_entry(sitemap, item, url, urls, languages,
+                                          protocol, domain))
+    yield smart_str(SITEMAP_FOOTER)
+
+
+def iter_sitemap_index_xml(sitemap_urls):
+    """
+    Yields the XML of the sitemap index listing ``sitemap_urls`` as UTF-8
+    encoded strings.
+    """
+    yield smart_str(INDEX_HEADER)
+    for url in sitemap_urls:
+        yield smart_str(u'<sitemap><loc>%s</loc></sitemap>\n' % escape(url))
+    yield smart_str(INDEX_FOOTER)
@@ -2,9 +2,9 @@ from django import template
 from django.template.defaultfilters import stringfilter
 
 from django.utils.translation import check_for_language
-from django.utils.translation.trans_real import translation
 
 from transurlvania.translators import NoTranslationError
+from transurlvania.urlresolvers import get_languages, get_ugettext
 
 
 register = template.Library()
@@ -102,6 +102,70 @@ class ThisPageInLangNode(template.Node):
             return output
 
 
+@register.tag
+def this_page_in_langs(parser, token):
+    """
+    Sets a context variable to a list of ``(lang, url)`` pairs giving the URL
+    for the equivalent of the current page in each language in
+    settings.LANGUAGES. Languages with no URL are left out.
+
+    Usage:
+
+        {% this_page_in_langs as lang_urls %}
+        {% for lang, url in lang_urls %}...{% endfor %}
+
+    """
+    bits = token_splitter(token)
+    if bits['args'] or not bits['context_var']:
+        raise template.TemplateSyntaxError, "%s tag must be used as {%% %s as var_name %%}" % (bits['tag_name'], bits['tag_name'])
+
+    return ThisPageInLangsNode(bits['context_var'])
+
+
+class ThisPageInLangsNode(template.Node):
+    def __init__(self, context_var):
+        self.context_var = context_var
+
+    def render(self, context):
+        try:
+            output = context['_url_translator'].get_urls(context=context)
+        except (KeyError, NoTranslationError), e:
+            output = []
+        context[self.context_var] = output
+        return ''
+
+
+# Whether a catalog was found for each language trans_in_lang has been used
+# with, starting with every language in settings.LANGUAGES.
+_language_checks = None
+
+# Strings translated by trans_in_lang, keyed by (lang, string). Cleared
+# whenever it reaches max_cached_translations.
+_translations = {}
+max_cached_translations = 5000
+
+
+def is_language_available(lang):
+    global _language_checks
+    if _language_checks is None:
+        _language_checks = dict([(code, check_for_language(code))
+                                 for code in get_languages()])
+    try:
+        return _language_checks[lang]
+    except KeyError:
+        available = _language_checks[lang] = check_for_language(lang)
+        return available
+
+
+def reset_trans_in_lang_cache():
+    """
+    Forgets the languages and translations cached by trans_in_lang.
+    """
+    global _language_checks
+    _language_checks = None
+    _translations.clear()
+
+
 @register.filter
 @stringfilter
 def trans_in_lang(string, lang):
@@ -114,6 +178,16 @@ def trans_in_lang(string, lang):
         {{ var|trans_in_lang:"fr" }}
 
     """
-    if check_for_language(lang):
-        return translation(lang).ugettext(string)
-    return string
+    key = (lang, string)
+    try:
+        return _translations[key]
+    except KeyError:
+        pass
+    if is_language_available(lang):
+        translated = get_ugettext(lang)(string)
+    else:
+        translated = string
+    if len(_translations) >= max_cached_translations:
+        _translations.clear()
+    _translations[key] = translated
+    return translated
@@ -1,6 +1,10 @@
+import time
+import weakref
+
 from django.core.urlresolvers import NoReverseMatch
 
-from transurlvania.urlresolvers import reverse_for_language
+from transurlvania import instrumentation
+from transurlvania.urlresolvers import reverse_for_language, get_languages
 
 
 class NoTranslationError(Exception):
@@ -18,11 +22,41 @@ class ViewInfo(object):
         return 'URL:%s, handled by %s(*%s, **%s)' % (self.current_url,
             self.view_func, self.view_args, self.view_kwargs)
 
+# Returned by get_context_object for schemes whose URLs URLTranslator
+# shouldn't reuse.
+UNCACHED = object()
+
+
 class BasicScheme(object):
     def get_url(self, lang, view_info, context=None):
         "The basic translation scheme just returns the current URL"
         return view_info.current_url
 
+    def get_context_object(self, context):
+        """
+        Returns the object in the context that the scheme's URLs depend on.
+        URLTranslator reuses URLs it has already got from the scheme for as
+        long as this stays the same object.
+
+        The template context itself stays the same object while the values
+        in it change (in a ``{% for %}`` loop, say), so by default the URLs
+        aren't reused at all.
+        """
+        return UNCACHED
+
+    def get_urls(self, langs, view_info, context=None):
+        """
+        Returns a dict mapping each language in ``langs`` that the page can be
+        translated into onto its URL in that language.
+        """
+        urls = {}
+        for lang in langs:
+            try:
+                urls[lang] = self.get_url(lang, view_info, context)
+            except NoTranslationError:
+                pass
+        return urls
+
 
 class ObjectBasedScheme(BasicScheme):
     """
@@ -36,14 +70,62 @@ class ObjectBasedScheme(BasicScheme):
     def __init__(self, object_name=None):
         self.object_name = object_name or self.DEFAULT_OBJECT_NAME
 
+    def get_context_object(self, context):
+        if context is None:
+            return None
+        return context.get(self.object_name)
+
+    def call_translation_method(self, obj, name, arg, langs):
+        """
+        Calls ``obj``'s ``get_translation`` or ``get_translations`` method,
+        and records it as a 'translation lookup' if instrumentation is on.
+        """
+        method = getattr(obj, name)
+        if not instrumentation.enabled:
+            return method(arg)
+        start = time.time()
+        try:
+            return method(arg)
+        finally:
+            instrumentation.record('translation lookup', name, time.time() - start,
+                                   languages=langs)
+
     def get_url(self, lang, view_info, context=None):
+        if context is None:
+            raise NoTranslationError(u'No context to find object named %s in.' % self.object_name)
         try:
-            return context[self.object_name].get_translation(lang).get_absolute_url()
+            obj = context[self.object_name]
         except KeyError:
             raise NoTranslationError(u'Could not find object named %s in context.' % self.object_name)
+        try:
+            return self.call_translation_method(obj, 'get_translation', lang, [lang]).get_absolute_url()
         except AttributeError:
             raise NoTranslationError(u'Unable to get translation of object %s '
-                                     u'in language %s' % (context[self.object_name], lang))
+                                     u'in language %s' % (obj, lang))
+
+    def get_urls(self, langs, view_info, context=None):
+        """
+        Uses the object's ``get_translations`` method, if it has one, to get
+        all of its translations at once. It gets passed the list of languages
+        and should return a dict mapping languages onto translations.
+        """
+        if context is None:
+            raise NoTranslationError(u'No context to find object named %s in.' % self.object_name)
+        try:
+            obj = context[self.object_name]
+        except KeyError:
+            raise NoTranslationError(u'Could not find object named %s in context.' % self.object_name)
+        if not hasattr(obj, 'get_translations'):
+            return super(ObjectBasedScheme, self).get_urls(langs, view_info, context)
+        translations = self.call_translation_method(obj, 'get_translations', langs, langs)
+        urls = {}
+        for lang in langs:
+            if lang in translations:
+                try:
+                    urls[lang] = translations[lang].get_absolute_url()
+                except AttributeError:
+                    pass
+        return urls
 
 
 class DirectToURLScheme(BasicScheme):
@@ -56,6 +138,9 @@ class DirectToURLScheme(BasicScheme):
     def __init__(self, url_name=None):
         self.url_name = url_name
 
+    def get_context_object(self, context):
+        return None
+
     def get_url(self, lang, view_info, context=None):
         view_func = self.url_name or view_info.view_func
         try:
@@ -75,33 +160,233 @@ class AutodetectScheme(BasicScheme):
         self.object_translator = ObjectBasedScheme(object_name)
         self.view_translator = DirectToURLScheme()
 
+    def get_context_object(self, context):
+        return self.object_translator.get_context_object(context)
+
     def get_url(self, lang, view_info, context=None):
         """
         Tries translating with the object based scheme and falls back to the
         direct-to-URL based scheme if that fails.
         """
         try:
-            return self.object_translator.get_url(lang, view_info, context)
+            url = self.object_translator.get_url(lang, view_info, context)
+            scheme = self.object_translator.__class__
         except NoTranslationError:
+            if instrumentation.enabled:
+                self.record_fallback('object', 'view', [lang], view_info)
             try:
-                return self.view_translator.get_url(lang, view_info, context)
+                url = self.view_translator.get_url(lang, view_info, context)
+                scheme = self.view_translator.__class__
             except NoTranslationError:
-                return super(AutodetectScheme, self).get_url(lang, view_info, context)
+                if instrumentation.enabled:
+                    self.record_fallback('view', 'current url', [lang], view_info)
+                url = super(AutodetectScheme, self).get_url(lang, view_info, context)
+                scheme = BasicScheme
+        if instrumentation.enabled:
+            self.record_result(scheme, [lang], view_info)
+        return url
+
+    def record_fallback(self, from_scheme, to_scheme, langs, view_info):
+        instrumentation.record('scheme fallback', (from_scheme, to_scheme), languages=langs,
+                               view=instrumentation.get_view_label(view_info.view_func))
+
+    def record_result(self, scheme, langs, view_info):
+        instrumentation.record('scheme result', scheme.__name__, languages=langs,
+                               view=instrumentation.get_view_label(view_info.view_func))
+
+    def get_urls(self, langs, view_info, context=None):
+        try:
+            urls = self.object_translator.get_urls(langs, view_info, context)
+        except NoTranslationError:
+            urls = {}
+        if urls and instrumentation.enabled:
+            self.record_result(self.object_translator.__class__,
+                               [lang for lang in langs if lang in urls], view_info)
+        missing = [lang for lang in langs if lang not in urls]
+        if missing:
+            if instrumentation.enabled:
+                self.record_fallback('object', 'view', missing, view_info)
+            found = self.view_translator.get_urls(missing, view_info, context)
+            if found and instrumentation.enabled:
+                self.record_result(self.view_translator.__class__,
+                                   [lang for lang in missing if lang in found], view_info)
+            urls.update(found)
+        missing = [lang for lang in langs if lang not in urls]
+        if missing and instrumentation.enabled:
+            self.record_fallback('view', 'current url', missing, view_info)
+            self.record_result(BasicScheme, missing, view_info)
+        for lang in missing:
+            urls[lang] = super(AutodetectScheme, self).get_url(lang, view_info, context)
+        return urls
+
+
+# Marks languages the current page has no URL in, in URLTranslator's cache.
+NO_TRANSLATION = object()
 
 
 class URLTranslator(object):
+    """
+    Gets the URLs of the current page in other languages using a translation
+    scheme. URLs are cached for the rest of the request, per language and
+    context object (see ``BasicScheme.get_context_object``), until the scheme
+    or the view info changes. URLs from schemes that don't say what they
+    depend on aren't cached.
+    """
     def __init__(self, current_url, scheme=None):
-        self.scheme = scheme or BasicScheme()
+        self._scheme = scheme or BasicScheme()
         self.view_info = ViewInfo(current_url, None, None, None)
+        self._urls = {}
+
+    def _get_scheme(self):
+        return self._scheme
+
+    def _set_scheme(self, scheme):
+        self._scheme = scheme
+        self._urls = {}
+    scheme = property(_get_scheme, _set_scheme)
 
     def set_view_info(self, view_func, view_args, view_kwargs):
         self.view_info.view_func = view_func
         self.view_info.view_args = view_args
         self.view_info.view_kwargs = view_kwargs
+        self._urls = {}
 
     def __unicode__(self):
         return 'URL Translator for %s. Using scheme: %s.' % (self.view_info,
                                                              self.scheme)
 
+    def _get_cached_url(self, lang, context_object):
+        if context_object is UNCACHED:
+            return None
+        try:
+            cached_object, url = self._urls[(lang, id(context_object))]
+        except KeyError:
+            return None
+        # The id of an object can be reused once the object is gone, so make
+        # sure it's really the same one.
+        if cached_object is not context_object:
+            return None
+        return url
+
+    def _cache_url(self, lang, context_object, url):
+        if context_object is UNCACHED:
+            return
+        self._urls[(lang, id(context_object))] = (context_object, url)
+
     def get_url(self, lang, context=None):
-        return self.scheme.get_url(lang, self.view_info, context)
\ No newline at end of file
+        context_object = self.scheme.get_context_object(context)
+        url = self._get_cached_url(lang, context_object)
+        if url is NO_TRANSLATION:
+            raise NoTranslationError(u'No URL for %s in language %s' % (self.view_info, lang))
+        if url is not None:
+            return url
+        try:
+            if instrumentation.enabled:
+                url = self._get_url_instrumented(lang, context)
+            else:
+                url = self.scheme.get_url(lang, self.view_info, context)
+        except NoTranslationError:
+            self._cache_url(lang, context_object, NO_TRANSLATION)
+            raise
+        self._cache_url(lang, context_object, url)
+        return url
+
+    def _record_scheme_lookup(self, langs, start):
+        instrumentation.record('scheme lookup', self.scheme.__class__.__name__,
+                               time.time() - start, languages=langs,
+                               view=instrumentation.get_view_label(self.view_info.view_func))
+
+    def _get_url_instrumented(self, lang, context):
+        start = time.time()
+        try:
+            return self.scheme.get_url(lang, self.view_info, context)
+        finally:
+            self._record_scheme_lookup([lang], start)
+
+    def _get_urls_instrumented(self, langs, context):
+        start = time.time()
+        try:
+            return self.scheme.get_urls(langs, self.view_info, context)
+        finally:
+            self._record_scheme_lookup(langs, start)
+
+    def get_urls(self, langs=None, context=None):
+        """
+        Returns a list of ``(lang, url)`` pairs for the current page in each
+        of ``langs`` (all of ``settings.LANGUAGES`` by default), leaving out
+        the languages the page can't be translated into.
+        """
+        if langs is None:
+            langs = get_languages()
+        context_object = self.scheme.get_context_object(context)
+        urls = {}
+        missing = []
+        for lang in langs:
+            url = self._get_cached_url(lang, context_object)
+            if url is None:
+                missing.append(lang)
+            else:
+                urls[lang] = url
+        if missing:
+            if instrumentation.enabled:
+                found = self._get_urls_instrumented(missing, context)
+            else:
+                found = self.scheme.get_urls(missing, self.view_info, context)
+            for lang in missing:
+                url = found.get(lang, NO_TRANSLATION)
+                self._cache_url(lang, context_object, url)
+                urls[lang] = url
+        return [(lang, urls[lang]) for lang in langs if urls[lang] is not NO_TRANSLATION]
+
+
+class LazyURLTranslator(object):
+    """
+    Stands in for a request's URLTranslator, and only creates it (which
+    includes working out the request's absolute URL) when it's first used.
+
+    The request is only weakly referenced, since it holds on to the lazy
+    translator, and a cycle between them would leave every request for the
+    cycle collector to free.
+    """
+    def __init__(self, request):
+        self._request = weakref.ref(request)
+        self._translator = None
+        self._scheme = None
+        self._view_info = None
+
+    def _get_translator(self):
+        if self._translator is None:
+            translator = URLTranslator(self._request().build_absolute_uri(), self._scheme)
+            if self._view_info is not None:
+                translator.set_view_info(*self._view_info)
+            self._translator = translator
+        return self._translator
+
+    def _get_scheme(self):
+        return self._get_translator().scheme
+
+    def _set_scheme(self, scheme):
+        if self._translator is None:
+            self._scheme = scheme
+        else:
+            self._translator.scheme = scheme
+    scheme = property(_get_scheme, _set_scheme)
+
+    def _get_view_info(self):
+        return self._get_translator().view_info
+    view_info = property(_get_view_info)
+
+    def set_view_info(self, view_func, view_args, view_kwargs):
+        if self._translator is None:
+            self._view_info = (view_func, view_args, view_kwargs)
+        else:
+            self._translator.set_view_info(view_func, view_args, view_kwargs)
+
+    def __unicode__(self):
+        return unicode(self._get_translator())
+
+    def get_url(self, lang, context=None):
+        return self._get_translator().get_url(lang, context)
+
+    def get_urls(self, langs=None, context=None):
+        return self._get_translator().get_urls(langs, context)
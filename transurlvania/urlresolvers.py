@@ -1,35 +1,515 @@
+import gc
 import re
+import threading
+import time
 
 from django.conf import settings
 from django.conf.urls.defaults import handler404, handler500
+from django.core.exceptions import ImproperlyConfigured, ViewDoesNotExist
 from django.core.urlresolvers import RegexURLPattern, RegexURLResolver, get_callable
-from django.core.urlresolvers import NoReverseMatch
+from django.core.urlresolvers import NoReverseMatch, Resolver404
 from django.core.urlresolvers import get_script_prefix
+from django.core import urlresolvers as django_urlresolvers
 from django.utils.datastructures import MultiValueDict
-from django.utils.encoding import iri_to_uri, force_unicode
+from django.utils.encoding import iri_to_uri, force_unicode, smart_str
 from django.utils.regex_helper import normalize
 from django.utils.translation import get_language
 from django.utils.translation.trans_real import translation
 
 import transurlvania.settings
+from transurlvania import instrumentation
+from transurlvania.indexes import RESOLVE_INDEXES
+from transurlvania.lru import LRUCache
+
+
+# Results of reverse_for_language, when MULTILANG_REVERSE_CACHE_SIZE is set.
+if transurlvania.settings.REVERSE_CACHE_SIZE:
+    reverse_cache = LRUCache(transurlvania.settings.REVERSE_CACHE_SIZE)
+else:
+    reverse_cache = None
+
+# Paths resolved by MultilangRegexURLResolver.resolve, when
+# MULTILANG_RESOLVE_CACHE_SIZE is set, and the paths that couldn't be
+# resolved, when MULTILANG_RESOLVE_404_CACHE_SIZE is set. They're kept apart
+# so that requests for random paths can't push the real ones out.
+if transurlvania.settings.RESOLVE_CACHE_SIZE:
+    resolve_cache = LRUCache(transurlvania.settings.RESOLVE_CACHE_SIZE)
+else:
+    resolve_cache = None
+if transurlvania.settings.RESOLVE_404_CACHE_SIZE:
+    resolve_404_cache = LRUCache(transurlvania.settings.RESOLVE_404_CACHE_SIZE)
+else:
+    resolve_404_cache = None
+
+# Whether a MultilangRegexURLResolver further up is resolving a path in the
+# current thread. Only the outermost one uses the resolve caches.
+_resolve_state = threading.local()
+
+
+class ResolverRegistry(object):
+    """
+    Holds the root resolver for each URLconf and language.
+
+    Building a resolver (including its reverse dict for its language) is
+    done by one thread at a time for each key: threads that ask for a
+    resolver while another thread is building it wait for that one instead of
+    building their own. A thread that asks for a resolver it's already
+    building (from a view module that reverses a URL as it's imported, say)
+    gets a separate one built on the spot, as it can't wait for itself. If
+    ``maxsize`` is set, the least recently used resolvers are dropped to make
+    room for new ones.
+    """
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize
+        if maxsize:
+            self._resolvers = LRUCache(maxsize)
+        else:
+            self._resolvers = {}
+        self._lock = threading.Lock()
+        # Maps the keys being built onto the Event set once they're built and
+        # the thread building them.
+        self._building = {}
+
+    def get(self, urlconf, lang):
+        key = (urlconf, lang)
+        resolver = self._resolvers.get(key)
+        if resolver is not None:
+            return resolver
+
+        self._lock.acquire()
+        try:
+            resolver = self._resolvers.get(key)
+            if resolver is not None:
+                return resolver
+            current_thread = threading.currentThread()
+            building, builder = self._building.get(key, (None, None))
+            if building is None:
+                building = threading.Event()
+                self._building[key] = (building, current_thread)
+                is_builder = True
+            else:
+                is_builder = False
+        finally:
+            self._lock.release()
+
+        if builder is current_thread:
+            return self.build(urlconf, lang)
+
+        if not is_builder:
+            building.wait()
+            resolver = self._resolvers.get(key)
+            if resolver is None:
+                # The build failed in the other thread, or the resolver has
+                # already been dropped again. Try again from the start.
+                return self.get(urlconf, lang)
+            return resolver
+
+        try:
+            resolver = self.build(urlconf, lang)
+            self._lock.acquire()
+            try:
+                if self.maxsize:
+                    self._resolvers.set(key, resolver)
+                else:
+                    self._resolvers[key] = resolver
+            finally:
+                self._lock.release()
+            # Any URLs cached for this URLconf and language came from the
+            # resolver being replaced.
+            if reverse_cache is not None:
+                reverse_cache.discard_where(
+                    lambda cache_key: cache_key[1] == lang and cache_key[2] == urlconf)
+        finally:
+            self._lock.acquire()
+            try:
+                del self._building[key]
+            finally:
+                self._lock.release()
+            building.set()
+        return resolver
+
+    def build(self, urlconf, lang):
+        prepare_urlconf(urlconf)
+        resolver = MultilangRegexURLResolver(r'^/', urlconf)
+        if transurlvania.settings.ROUTING_TABLE:
+            from transurlvania import routing_table
+            routing_table.load_root_resolver(resolver, urlconf, lang)
+        resolver.get_reverse_dict(lang)
+        return resolver
+
+    def warm(self, urlconf=None, languages=None):
+        """
+        Builds the resolvers for the URLconf in each of ``languages`` (all of
+        ``settings.LANGUAGES`` by default) ahead of time.
+        """
+        if urlconf is None:
+            urlconf = settings.ROOT_URLCONF
+        languages = languages or get_languages()
+        # Build the reverse dicts of the included URLconfs for every language
+        # at once, leaving only the top level to each language's resolver.
+        for pattern in MultilangRegexURLResolver(r'^/', urlconf).url_patterns:
+            if hasattr(pattern, 'build_reverse_dicts') and not pattern.namespace:
+                pattern.build_reverse_dicts(languages)
+        for lang in languages:
+            self.get(urlconf, lang)
+
+    def preload(self, urlconf=None, languages=None):
+        """
+        Builds the resolvers for the URLconf in each of ``languages`` (all of
+        ``settings.LANGUAGES`` by default), along with everything they would
+        otherwise fill in lazily while serving requests: compiled regexes,
+        view callbacks, reverse, namespace and app dicts, reverse indexes for
+        every view and resolve indexes. Nothing is added to them afterwards.
+
+        Call it in a prefork server's master process before the workers are
+        forked, so that they share the memory holding all of this instead of
+        each building a copy of its own.
+        """
+        if urlconf is None:
+            urlconf = settings.ROOT_URLCONF
+        languages = languages or get_languages()
+        compile_all_languages(urlconf, languages)
+        self.warm(urlconf, languages)
+        for lang in languages:
+            root = self.get(urlconf, lang)
+            # Compiled by compile_all_languages for every pattern but the root.
+            for regex_lang in languages:
+                root.get_regex(regex_lang)
+            resolvers = [root] + [pattern for pattern in iter_url_patterns(root.url_patterns)
+                                  if hasattr(pattern, 'get_reverse_dict')]
+            for resolver in resolvers:
+                reverse_dict = resolver.get_reverse_dict(lang)
+                for lookup_view in reverse_dict:
+                    resolver.get_reverse_index(lookup_view, lang)
+                if transurlvania.settings.RESOLVE_ENGINE != 'sequential':
+                    resolver.get_resolve_index(lang)
+        for pattern in iter_url_patterns(self.get(urlconf, languages[0]).url_patterns):
+            if not isinstance(pattern, RegexURLResolver):
+                try:
+                    pattern.callback
+                except ViewDoesNotExist:
+                    # Left for the request that uses it to report.
+                    pass
+        # Collecting now leaves less garbage for the workers to collect, which
+        # would write to the shared pages.
+        gc.collect()
+
+    def discard(self, urlconf, lang):
+        self._lock.acquire()
+        try:
+            if self.maxsize:
+                self._resolvers.discard((urlconf, lang))
+            else:
+                self._resolvers.pop((urlconf, lang), None)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._resolvers.clear()
+        finally:
+            self._lock.release()
+
+    def keys(self):
+        """
+        Returns the ``(urlconf, lang)`` keys of the resolvers in the registry.
+        """
+        return list(self._resolvers.keys())
+
+    def __contains__(self, key):
+        return key in self._resolvers
+
+    def __len__(self):
+        return len(self._resolvers)
+
+
+resolver_registry = ResolverRegistry(transurlvania.settings.RESOLVER_CACHE_SIZE)
 
 
-_resolvers = {}
 def get_resolver(urlconf, lang):
     if urlconf is None:
         from django.conf import settings
         urlconf = settings.ROOT_URLCONF
-    key = (urlconf, lang)
-    if key not in _resolvers:
-        _resolvers[key] = MultilangRegexURLResolver(r'^/', urlconf)
-    return _resolvers[key]
+    return resolver_registry.get(urlconf, lang)
+
+
+def get_resolver_for_active_language(urlconf):
+    """
+    Drop-in replacement for ``django.core.urlresolvers.get_resolver`` that
+    returns the cached resolver for the URLconf in the active language.
+    """
+    return get_resolver(urlconf, get_language())
+
+
+def clear_resolver_cache():
+    resolver_registry.clear()
+    for cache in (reverse_cache, resolve_cache, resolve_404_cache):
+        if cache is not None:
+            cache.clear()
+
+
+def get_resolve_cache_stats():
+    """
+    Returns the hits, misses and sizes of the resolve caches, as dicts keyed
+    'resolved' and 'not found', or None for a cache that isn't enabled.
+    """
+    stats = {}
+    for name, cache in (('resolved', resolve_cache), ('not found', resolve_404_cache)):
+        if cache is None:
+            stats[name] = None
+        else:
+            stats[name] = cache.stats()
+    return stats
+
+
+def install_resolver_cache():
+    """
+    Makes Django's ``get_resolver`` (and, through it, ``reverse`` and
+    ``resolve``) use the language-keyed resolver cache.
+
+    Django's own cache holds one resolver per URLconf, which gets locked into
+    whichever language it was first used in. The cache here holds one per
+    URLconf and language, so it never has to be cleared between requests.
+    """
+    django_urlresolvers.get_resolver = get_resolver_for_active_language
+
+
+# The ugettext function of each language's catalog, so that translating URL
+# patterns doesn't go through trans_real.translation's global lookup.
+_ugettext_handles = {}
+def get_ugettext(lang):
+    """
+    Returns the ``ugettext`` function of the catalog for ``lang``, loading the
+    catalog the first time it's asked for.
+    """
+    try:
+        return _ugettext_handles[lang]
+    except KeyError:
+        handle = translation(lang).ugettext
+        _ugettext_handles[lang] = handle
+        return handle
+
+
+def reload_catalogs():
+    """
+    Forgets the catalog handles returned by ``get_ugettext`` and the strings
+    translated by the ``trans_in_lang`` filter, so they're fetched from Django
+    again the next time they're needed. Call it after replacing the catalogs
+    Django has loaded. Regexes that have already been translated aren't
+    affected.
+    """
+    from transurlvania.templatetags.transurlvania_tags import reset_trans_in_lang_cache
+    _ugettext_handles.clear()
+    reset_trans_in_lang_cache()
+
+
+def translate_regex(raw_regex, lang):
+    """
+    Returns the translation of a URL pattern's regex string in ``lang``.
+    """
+    # Only attempt to get the translation of the regex if the regex string
+    # is not empty. The empty string is handled as a special case by
+    # Django's gettext. It's where it stores its metadata.
+    if raw_regex == '':
+        return raw_regex
+    if not instrumentation.enabled:
+        return get_ugettext(lang)(raw_regex)
+    start = time.time()
+    translated = get_ugettext(lang)(raw_regex)
+    instrumentation.record('gettext lookup', lang, time.time() - start, regex=raw_regex)
+    return translated
+
+
+def compile_translated_regex(raw_regex, lang):
+    """
+    Returns the compiled translation of a URL pattern's regex string in
+    ``lang``.
+    """
+    if not instrumentation.enabled:
+        return re.compile(translate_regex(raw_regex, lang), re.UNICODE)
+    start = time.time()
+    regex = re.compile(translate_regex(raw_regex, lang), re.UNICODE)
+    instrumentation.record('regex compile', lang, time.time() - start, regex=raw_regex)
+    return regex
+
+
+def split_lang_prefix(path):
+    """
+    Splits a path (without its leading slash) into the language code in its
+    first segment and the rest of the path after the slash that follows it.
+    The rest is None if there's no slash after the language code.
+    """
+    lang_code, slash, rest = path.partition('/')
+    if not slash:
+        return lang_code, None
+    return lang_code, rest
+
+
+def iter_url_patterns(url_patterns):
+    """
+    Walks a list of URL patterns depth first, yielding every pattern and
+    resolver in it, including the contents of included URLconfs.
+    """
+    for pattern in url_patterns:
+        yield pattern
+        if isinstance(pattern, RegexURLResolver):
+            for sub_pattern in iter_url_patterns(pattern.url_patterns):
+                yield sub_pattern
+
+
+def get_languages():
+    return [code for (code, name) in settings.LANGUAGES]
+
+
+_compiled_urlconfs = set()
+def compile_all_languages(urlconf=None, languages=None):
+    """
+    Compiles the regex of every translatable pattern in the URLconf for every
+    language in ``languages`` (all of ``settings.LANGUAGES`` by default), so
+    that resolving and reversing never have to go through gettext.
+    """
+    if urlconf is None:
+        urlconf = settings.ROOT_URLCONF
+    languages = languages or get_languages()
+    url_patterns = MultilangRegexURLResolver(r'^/', urlconf).url_patterns
+    for pattern in iter_url_patterns(url_patterns):
+        if hasattr(pattern, 'get_regex'):
+            for lang in languages:
+                pattern.get_regex(lang)
+    _compiled_urlconfs.add(urlconf)
+
+
+def prepare_urlconf(urlconf=None):
+    """
+    Loads the routing table named by MULTILANG_ROUTING_TABLE and compiles the
+    URLconf's regexes for every language if MULTILANG_PRECOMPILE_URLS is set,
+    unless that's already been done for the URLconf. Returns True if it did
+    either.
+
+    It's called when a root resolver is built, and when a pattern's regex is
+    first needed in a language, since Django's request handler resolves
+    through a plain RegexURLResolver of its own that never goes through the
+    resolver registry.
+    """
+    if not (transurlvania.settings.ROUTING_TABLE or transurlvania.settings.PRECOMPILE_URLS):
+        return False
+    if urlconf is None:
+        urlconf = settings.ROOT_URLCONF
+    prepared = False
+    if transurlvania.settings.ROUTING_TABLE:
+        from transurlvania import routing_table
+        prepared = routing_table.load_configured_routing_table(urlconf)
+    if transurlvania.settings.PRECOMPILE_URLS and urlconf not in _compiled_urlconfs:
+        # Marked first so that compiling the regexes doesn't come back here.
+        _compiled_urlconfs.add(urlconf)
+        compile_all_languages(urlconf)
+        prepared = True
+    return prepared
+
+
+def get_regex_table(urlconf=None):
+    """
+    Returns a list of ``(pattern, {lang: compiled_regex})`` pairs describing
+    the regexes compiled so far for each translatable pattern in the URLconf.
+    """
+    if urlconf is None:
+        urlconf = settings.ROOT_URLCONF
+    url_patterns = MultilangRegexURLResolver(r'^/', urlconf).url_patterns
+    return [(pattern, dict(pattern._regex_dict))
+            for pattern in iter_url_patterns(url_patterns)
+            if hasattr(pattern, '_regex_dict')]
+
+
+_normalized_regexes = {}
+def get_normalized(regex):
+    """
+    Returns ``normalize(regex)``, remembering the result so that it's shared
+    by every pattern and language with the same regex.
+    """
+    try:
+        return _normalized_regexes[regex]
+    except KeyError:
+        bits = normalize(regex)
+        _normalized_regexes[regex] = bits
+        return bits
+
+
+_candidate_regexes = {}
+def get_candidate_regex(pattern):
+    """
+    Returns the compiled regex used to check that a URL built from a reverse
+    dict entry really matches the entry's pattern.
+    """
+    try:
+        return _candidate_regexes[pattern]
+    except KeyError:
+        regex = re.compile(u'^%s' % pattern, re.UNICODE)
+        _candidate_regexes[pattern] = regex
+        return regex
+
+
+def build_reverse_index(possibilities):
+    """
+    Takes the list of ``(possibility, pattern)`` entries found in a reverse
+    dict for one view, and returns two dicts that group the URL templates in
+    them by the number of positional arguments and by the set of keyword
+    arguments they take. Each template comes as a ``(result, params, regex)``
+    triple, in the same order as in the reverse dict.
+    """
+    by_arity = {}
+    by_kwarg_names = {}
+    for possibility, pattern in possibilities:
+        candidate_regex = get_candidate_regex(pattern)
+        for result, params in possibility:
+            template = (result, params, candidate_regex)
+            by_arity.setdefault(len(params), []).append(template)
+            by_kwarg_names.setdefault(frozenset(params), []).append(template)
+    return by_arity, by_kwarg_names
 
 
 def reverse_for_language(viewname, lang, urlconf=None, args=None, kwargs=None, prefix=None, current_app=None):
-    # Based on code in Django 1.1.1 in reverse and RegexURLResolver.reverse 
-    # in django.core.urlresolvers.
     args = args or []
     kwargs = kwargs or {}
+    if prefix is None:
+        prefix = get_script_prefix()
+
+    if reverse_cache is None:
+        uri = _reverse_path_for_language(viewname, lang, urlconf, args, kwargs, prefix, current_app)
+    else:
+        # The arguments are keyed on their unicode values because that's
+        # what ends up in the URL, and because model instances compare equal
+        # by primary key alone.
+        key = (
+            viewname, lang, urlconf or settings.ROOT_URLCONF,
+            tuple([force_unicode(val) for val in args]),
+            frozenset([(k, force_unicode(v)) for (k, v) in kwargs.items()]),
+            prefix, current_app,
+        )
+        uri = reverse_cache.get(key)
+        if uri is not None and instrumentation.enabled:
+            instrumentation.record('reverse cache hit',
+                                   (instrumentation.get_view_label(viewname), lang))
+        if uri is None:
+            uri = _reverse_path_for_language(viewname, lang, urlconf, args, kwargs, prefix, current_app)
+            reverse_cache.set(key, uri)
+
+    # If we have a separate domain for lang, put that in the URL
+    domain = transurlvania.settings.LANGUAGE_DOMAINS.get(lang, None)
+    if domain:
+        uri = iri_to_uri(u'http://%s%s' % (domain[0], uri))
+    return uri
+
+
+def get_reverse_templates(viewname, lang, urlconf=None, prefix=None, current_app=None):
+    """
+    Looks up ``viewname`` (a view, its dotted path or a URL name, with any
+    namespaces) in ``lang``. Returns the path prefix that its URLs start
+    with, the view, and its URL templates grouped by arguments (see
+    ``build_reverse_index``).
+    """
+    # Based on code in Django 1.1.1 in reverse and RegexURLResolver.reverse 
+    # in django.core.urlresolvers.
     if prefix is None:
         prefix = get_script_prefix()
     resolver = get_resolver(urlconf, lang)
@@ -48,7 +528,10 @@ def reverse_for_language(viewname, lang, urlconf=None, args=None, kwargs=None, p
 
             # Lookup the name to see if it could be an app identifier
             try:
-                app_list = resolver.app_dict[ns]
+                if hasattr(resolver, 'get_app_dict'):
+                    app_list = resolver.get_app_dict(lang)[ns]
+                else:
+                    app_list = resolver.app_dict[ns]
                 # Yes! Path part matches an app in the current Resolver
                 if current_app and current_app in app_list:
                     # If we are reversing for a particular app, use that namespace
@@ -61,7 +544,10 @@ def reverse_for_language(viewname, lang, urlconf=None, args=None, kwargs=None, p
                 pass
 
             try:
-                extra, resolver = resolver.namespace_dict[ns]
+                if hasattr(resolver, 'get_namespace_dict'):
+                    extra, resolver = resolver.get_namespace_dict(lang)[ns]
+                else:
+                    extra, resolver = resolver.namespace_dict[ns]
                 resolved_path.append(ns)
                 prefix = prefix + extra
             except KeyError, key:
@@ -70,35 +556,52 @@ def reverse_for_language(viewname, lang, urlconf=None, args=None, kwargs=None, p
                 else:
                     raise NoReverseMatch("%s is not a registered namespace" % key)
 
-    if args and kwargs:
-        raise ValueError("Don't mix *args and **kwargs in call to reverse()!")
     try:
         lookup_view = get_callable(view, True)
     except (ImportError, AttributeError), e:
         raise NoReverseMatch("Error importing '%s': %s." % (lookup_view, e))
-    if hasattr(resolver, 'get_reverse_dict'):
-        possibilities = resolver.get_reverse_dict(lang).getlist(lookup_view)
+    if hasattr(resolver, 'get_reverse_index'):
+        by_arity, by_kwarg_names = resolver.get_reverse_index(lookup_view, lang)
     else:
-        possibilities = resolver.reverse_dict.getlist(lookup_view)
-    for possibility, pattern in possibilities:
-        for result, params in possibility:
-            if args:
-                if len(args) != len(params):
-                    continue
-                unicode_args = [force_unicode(val) for val in args]
-                candidate =  result % dict(zip(params, unicode_args))
-            else:
-                if set(kwargs.keys()) != set(params):
-                    continue
-                unicode_kwargs = dict([(k, force_unicode(v)) for (k, v) in kwargs.items()])
-                candidate = result % unicode_kwargs
-            if re.search(u'^%s' % pattern, candidate, re.UNICODE):
-                iri = u'%s%s' % (prefix, candidate)
-                # If we have a separate domain for lang, put that in the iri
-                domain = transurlvania.settings.LANGUAGE_DOMAINS.get(lang, None)
-                if domain:
-                    iri = u'http://%s%s' % (domain[0], iri)
-                return iri_to_uri(iri)
+        by_arity, by_kwarg_names = build_reverse_index(
+            resolver.reverse_dict.getlist(lookup_view))
+    return prefix, lookup_view, by_arity, by_kwarg_names
+
+
+def get_candidates(by_arity, by_kwarg_names, args, kwargs):
+    """
+    Returns the URL templates that take ``args`` or ``kwargs``.
+    """
+    if args and kwargs:
+        raise ValueError("Don't mix *args and **kwargs in call to reverse()!")
+    if args:
+        return by_arity.get(len(args), ())
+    return by_kwarg_names.get(frozenset(kwargs), ())
+
+
+def fill_candidates(candidates, args, kwargs):
+    """
+    Returns the position of the first of ``candidates`` that matches once
+    filled in with ``args`` or ``kwargs``, and the filled in template, or
+    ``(len(candidates), None)`` if none of them match.
+    """
+    if not candidates:
+        return 0, None
+    if args:
+        unicode_args = [force_unicode(val) for val in args]
+    else:
+        unicode_kwargs = dict([(k, force_unicode(v)) for (k, v) in kwargs.items()])
+    for position, (result, params, candidate_regex) in enumerate(candidates):
+        if args:
+            candidate = result % dict(zip(params, unicode_args))
+        else:
+            candidate = result % unicode_kwargs
+        if candidate_regex.search(candidate):
+            return position, candidate
+    return len(candidates), None
+
+
+def no_reverse_match(lookup_view, args, kwargs):
     # lookup_view can be URL label, or dotted path, or callable, Any of
     # these can be passed in at the top, but callables are not friendly in
     # error messages.
@@ -108,10 +611,64 @@ def reverse_for_language(viewname, lang, urlconf=None, args=None, kwargs=None, p
         lookup_view_s = "%s.%s" % (m, n)
     else:
         lookup_view_s = lookup_view
-    raise NoReverseMatch("Reverse for '%s' with arguments '%s' and keyword "
+    return NoReverseMatch("Reverse for '%s' with arguments '%s' and keyword "
             "arguments '%s' not found." % (lookup_view_s, args, kwargs))
 
 
+def _reverse_path_for_language(viewname, lang, urlconf, args, kwargs, prefix, current_app):
+    instrumented = instrumentation.enabled
+    if instrumented:
+        start = time.time()
+    prefix, lookup_view, by_arity, by_kwarg_names = get_reverse_templates(
+        viewname, lang, urlconf, prefix, current_app)
+    candidates = get_candidates(by_arity, by_kwarg_names, args, kwargs)
+    position, candidate = fill_candidates(candidates, args, kwargs)
+    if instrumented:
+        instrumentation.record('reverse', (instrumentation.get_view_label(viewname), lang),
+                               time.time() - start, candidates=min(position + 1, len(candidates)))
+    if candidate is None:
+        raise no_reverse_match(lookup_view, args, kwargs)
+    return iri_to_uri(u'%s%s' % (prefix, candidate))
+
+
+def reverse_many(lookups, urlconf=None, prefix=None, current_app=None):
+    """
+    Takes an iterable of ``(viewname, lang, args, kwargs)`` tuples, and yields
+    the URL for each of them in turn, as ``reverse_for_language`` would
+    return it (but without going through its cache).
+
+    Each view is looked up only once for each language and set of
+    arguments, so this is much faster than calling ``reverse_for_language``
+    for each tuple when many of them are for the same view.
+    """
+    if prefix is None:
+        prefix = get_script_prefix()
+    # Maps (viewname, lang, arguments) onto (prefix, view, candidates, domain).
+    targets = {}
+    for viewname, lang, args, kwargs in lookups:
+        args = args or ()
+        kwargs = kwargs or {}
+        if args:
+            signature = (viewname, lang, len(args))
+        else:
+            signature = (viewname, lang, frozenset(kwargs))
+        try:
+            path_prefix, lookup_view, candidates, domain = targets[signature]
+        except KeyError:
+            path_prefix, lookup_view, by_arity, by_kwarg_names = get_reverse_templates(
+                viewname, lang, urlconf, prefix, current_app)
+            candidates = get_candidates(by_arity, by_kwarg_names, args, kwargs)
+            domain = transurlvania.settings.LANGUAGE_DOMAINS.get(lang, None)
+            targets[signature] = path_prefix, lookup_view, candidates, domain
+        position, candidate = fill_candidates(candidates, args, kwargs)
+        if candidate is None:
+            raise no_reverse_match(lookup_view, args, kwargs)
+        if domain:
+            yield iri_to_uri(u'http://%s%s%s' % (domain[0], path_prefix, candidate))
+        else:
+            yield iri_to_uri(u'%s%s' % (path_prefix, candidate))
+
+
 class MultilangRegexURLPattern(RegexURLPattern):
     def __init__(self, regex, callback, default_args=None, name=None):
         # Copied from django.core.urlresolvers.RegexURLPattern, with one change:
@@ -131,9 +688,19 @@ class MultilangRegexURLPattern(RegexURLPattern):
 
     def get_regex(self, lang=None):
         lang = lang or get_language()
-        return self._regex_dict.setdefault(lang, re.compile(translation(lang).ugettext(self._raw_regex), re.UNICODE))
+        try:
+            return self._regex_dict[lang]
+        except KeyError:
+            if prepare_urlconf():
+                return self.get_regex(lang)
+            regex = compile_translated_regex(self._raw_regex, lang)
+            self._regex_dict[lang] = regex
+            return regex
     regex = property(get_regex)
 
+    def set_regex(self, lang, regex):
+        self._regex_dict[lang] = regex
+
 
 class MultilangRegexURLResolver(RegexURLResolver):
     def __init__(self, regex, urlconf_name, default_kwargs=None, app_name=None, namespace=None):
@@ -148,64 +715,216 @@ class MultilangRegexURLResolver(RegexURLResolver):
         self.namespace = namespace
         self.app_name = app_name
         self._lang_reverse_dicts = {}
-        self._namespace_dict = None
-        self._app_dict = None
+        self._lang_reverse_indexes = {}
+        self._lang_namespace_dicts = {}
+        self._lang_app_dicts = {}
         self._regex_dict = {}
+        self._lang_resolve_indexes = {}
 
     def get_regex(self, lang=None):
         lang = lang or get_language()
-        # Only attempt to get the translation of the regex if the regex string
-        # is not empty. The empty string is handled as a special case by
-        # Django's gettext. It's where it stores its metadata.
-        if self._raw_regex != '':
-            regex_in_lang = translation(lang).ugettext(self._raw_regex)
-        else:
-            regex_in_lang = self._raw_regex
-        return self._regex_dict.setdefault(lang, re.compile(regex_in_lang, re.UNICODE))
+        try:
+            return self._regex_dict[lang]
+        except KeyError:
+            if prepare_urlconf():
+                return self.get_regex(lang)
+            regex = compile_translated_regex(self._raw_regex, lang)
+            self._regex_dict[lang] = regex
+            return regex
     regex = property(get_regex)
 
-    def _build_reverse_dict_for_lang(self, lang):
-        reverse_dict = MultiValueDict()
-        namespaces = {}
-        apps = {}
-        for pattern in reversed(self.url_patterns):
-            if hasattr(pattern, 'get_regex'):
-                p_pattern = pattern.get_regex(lang).pattern
-            else:
-                p_pattern = pattern.regex.pattern
-            if p_pattern.startswith('^'):
-                p_pattern = p_pattern[1:]
-            if isinstance(pattern, RegexURLResolver):
-                if pattern.namespace:
-                    namespaces[pattern.namespace] = (p_pattern, pattern)
-                    if pattern.app_name:
-                        apps.setdefault(pattern.app_name, []).append(pattern.namespace)
+    def set_regex(self, lang, regex):
+        self._regex_dict[lang] = regex
+
+    def get_resolve_index(self, lang=None):
+        """
+        Returns the index used to pick out the child patterns worth trying
+        for a path in ``lang``, as selected by MULTILANG_RESOLVE_ENGINE.
+        """
+        lang = lang or get_language()
+        engine = transurlvania.settings.RESOLVE_ENGINE
+        try:
+            return self._lang_resolve_indexes[(engine, lang)]
+        except KeyError:
+            try:
+                index_class = RESOLVE_INDEXES[engine]
+            except KeyError:
+                raise ImproperlyConfigured('Unknown URL resolve engine: %s' % engine)
+            regexes = []
+            for pattern in self.url_patterns:
+                if hasattr(pattern, 'get_regex'):
+                    regexes.append(pattern.get_regex(lang).pattern)
                 else:
-                    if hasattr(pattern, 'get_regex'):
-                        parent = normalize(pattern.get_regex(lang).pattern)
+                    regexes.append(pattern.regex.pattern)
+            index = index_class(regexes)
+            self._lang_resolve_indexes[(engine, lang)] = index
+            return index
+
+    def resolve(self, path):
+        if ((resolve_cache is None and resolve_404_cache is None)
+                or getattr(_resolve_state, 'resolving', False)):
+            return self._resolve(path)
+
+        key = (self, get_language(), path)
+        if resolve_cache is not None:
+            match = resolve_cache.get(key)
+            if match is not None:
+                callback, args, kwargs = match
+                return callback, args, dict(kwargs)
+        if resolve_404_cache is not None:
+            not_found = resolve_404_cache.get(key)
+            if not_found is not None:
+                raise Resolver404, not_found
+
+        _resolve_state.resolving = True
+        try:
+            try:
+                match = self._resolve(path)
+            except Resolver404, e:
+                if resolve_404_cache is not None:
+                    resolve_404_cache.set(key, e.args[0])
+                raise
+        finally:
+            _resolve_state.resolving = False
+        if resolve_cache is not None:
+            callback, args, kwargs = match
+            resolve_cache.set(key, (callback, args, dict(kwargs)))
+        return match
+
+    def _resolve(self, path):
+        if transurlvania.settings.RESOLVE_ENGINE == 'sequential':
+            return super(MultilangRegexURLResolver, self).resolve(path)
+        lang = get_language()
+        match = self.get_regex(lang).search(path)
+        if match:
+            return self.resolve_sub_path(path, path[match.end():], lang, match.groupdict())
+        raise Resolver404, {'path' : path}
+
+    def resolve_sub_path(self, path, new_path, lang, groups):
+        """
+        Resolves ``new_path``, the part of ``path`` left over once this
+        resolver's own regex has matched it (capturing ``groups``), against
+        the child patterns.
+        """
+        url_patterns = self.url_patterns
+        sequential = transurlvania.settings.RESOLVE_ENGINE == 'sequential'
+        if sequential:
+            positions = xrange(len(url_patterns))
+        else:
+            positions = self.get_resolve_index(lang).candidates(new_path)
+        tried = []
+        for position in positions:
+            pattern = url_patterns[position]
+            try:
+                sub_match = pattern.resolve(new_path)
+            except Resolver404, e:
+                if sequential:
+                    sub_tried = e.args[0].get('tried')
+                    if sub_tried is not None:
+                        tried.extend([(pattern.regex.pattern + '   ' + t) for t in sub_tried])
                     else:
-                        parent = normalize(pattern.regex.pattern)
-                    if hasattr(pattern, 'get_reverse_dict'):
-                        sub_reverse_dict = pattern.get_reverse_dict(lang)
+                        tried.append(pattern.regex.pattern)
+                continue
+            if sub_match:
+                sub_match_dict = dict([(smart_str(k), v) for k, v in groups.items()])
+                sub_match_dict.update(self.default_kwargs)
+                for k, v in sub_match[2].iteritems():
+                    sub_match_dict[smart_str(k)] = v
+                return sub_match[0], sub_match[1], sub_match_dict
+            if sequential:
+                tried.append(pattern.regex.pattern)
+        if not sequential and settings.DEBUG:
+            # Resolve the slow way to collect the list of patterns tried
+            # for the debug 404 page.
+            return super(MultilangRegexURLResolver, self).resolve(path)
+        raise Resolver404, {'tried': tried, 'path': new_path}
+
+    def build_reverse_dicts(self, languages):
+        """
+        Builds the reverse, namespace and app dicts for each of ``languages``
+        that doesn't have them yet, in a single walk through the URL
+        patterns. Patterns whose regex is the same in several languages share
+        their reverse dict entries between those languages.
+        """
+        languages = [lang for lang in languages if lang not in self._lang_reverse_dicts]
+        if not languages:
+            return
+        instrumented = instrumentation.enabled
+        if instrumented:
+            start = time.time()
+        reverse_dicts = dict([(lang, MultiValueDict()) for lang in languages])
+        namespaces = dict([(lang, {}) for lang in languages])
+        apps = dict([(lang, {}) for lang in languages])
+        # Entries already built for a regex (and, for included patterns, the
+        # included entry they extend), so other languages can reuse them.
+        entries = {}
+        for pattern in reversed(self.url_patterns):
+            if (isinstance(pattern, RegexURLResolver) and not pattern.namespace
+                    and hasattr(pattern, 'build_reverse_dicts')):
+                pattern.build_reverse_dicts(languages)
+            for lang in languages:
+                if hasattr(pattern, 'get_regex'):
+                    regex = pattern.get_regex(lang).pattern
+                else:
+                    regex = pattern.regex.pattern
+                p_pattern = regex
+                if p_pattern.startswith('^'):
+                    p_pattern = p_pattern[1:]
+                reverse_dict = reverse_dicts[lang]
+                if isinstance(pattern, RegexURLResolver):
+                    if pattern.namespace:
+                        namespaces[lang][pattern.namespace] = (p_pattern, pattern)
+                        if pattern.app_name:
+                            apps[lang].setdefault(pattern.app_name, []).append(pattern.namespace)
                     else:
-                        sub_reverse_dict = pattern.reverse_dict
-                    for name in sub_reverse_dict:
-                        for matches, pat in sub_reverse_dict.getlist(name):
-                            new_matches = []
-                            for piece, p_args in parent:
-                                new_matches.extend([(piece + suffix, p_args + args) for (suffix, args) in matches])
-                            reverse_dict.appendlist(name, (new_matches, p_pattern + pat))
-                    for namespace, (prefix, sub_pattern) in pattern.namespace_dict.items():
-                        namespaces[namespace] = (p_pattern + prefix, sub_pattern)
-                    for app_name, namespace_list in pattern.app_dict.items():
-                        apps.setdefault(app_name, []).extend(namespace_list)
-            else:
-                bits = normalize(p_pattern)
-                reverse_dict.appendlist(pattern.callback, (bits, p_pattern))
-                reverse_dict.appendlist(pattern.name, (bits, p_pattern))
-        self._namespace_dict = namespaces
-        self._app_dict = apps
-        return reverse_dict
+                        parent = get_normalized(regex)
+                        if hasattr(pattern, 'get_reverse_dict'):
+                            sub_reverse_dict = pattern.get_reverse_dict(lang)
+                        else:
+                            sub_reverse_dict = pattern.reverse_dict
+                        for name in sub_reverse_dict:
+                            for sub_entry in sub_reverse_dict.getlist(name):
+                                key = (regex, id(sub_entry))
+                                try:
+                                    entry = entries[key]
+                                except KeyError:
+                                    matches, pat = sub_entry
+                                    new_matches = []
+                                    for piece, p_args in parent:
+                                        new_matches.extend([(piece + suffix, p_args + args) for (suffix, args) in matches])
+                                    entry = entries[key] = (new_matches, p_pattern + pat)
+                                reverse_dict.appendlist(name, entry)
+                        if hasattr(pattern, 'get_namespace_dict'):
+                            sub_namespace_dict = pattern.get_namespace_dict(lang)
+                            sub_app_dict = pattern.get_app_dict(lang)
+                        else:
+                            sub_namespace_dict = pattern.namespace_dict
+                            sub_app_dict = pattern.app_dict
+                        for namespace, (prefix, sub_pattern) in sub_namespace_dict.items():
+                            namespaces[lang][namespace] = (p_pattern + prefix, sub_pattern)
+                        for app_name, namespace_list in sub_app_dict.items():
+                            apps[lang].setdefault(app_name, []).extend(namespace_list)
+                else:
+                    try:
+                        entry = entries[regex]
+                    except KeyError:
+                        entry = entries[regex] = (get_normalized(p_pattern), p_pattern)
+                    reverse_dict.appendlist(pattern.callback, entry)
+                    reverse_dict.appendlist(pattern.name, entry)
+        for lang in languages:
+            self._lang_namespace_dicts[lang] = namespaces[lang]
+            self._lang_app_dicts[lang] = apps[lang]
+            self._lang_reverse_dicts[lang] = reverse_dicts[lang]
+        if instrumented:
+            # The languages are built together, so they share the time.
+            seconds = (time.time() - start) / len(languages)
+            urlconf = instrumentation.get_urlconf_label(self.urlconf_name)
+            for lang in languages:
+                instrumentation.record('reverse dict build', (urlconf, lang), seconds)
+
+    def _build_reverse_dict_for_lang(self, lang):
+        self.build_reverse_dicts([lang])
+        return self._lang_reverse_dicts[lang]
 
     def get_reverse_dict(self, lang=None):
         if lang is None:
@@ -215,6 +934,145 @@ class MultilangRegexURLResolver(RegexURLResolver):
         return self._lang_reverse_dicts[lang]
     reverse_dict = property(get_reverse_dict)
 
+    def get_reverse_index(self, lookup_view, lang=None):
+        """
+        Returns the URL templates for ``lookup_view`` in ``lang``, grouped by
+        their arguments. See ``build_reverse_index``.
+        """
+        if lang is None:
+            lang = get_language()
+        try:
+            return self._lang_reverse_indexes[lang][lookup_view]
+        except KeyError:
+            reverse_dict = self.get_reverse_dict(lang)
+            index = build_reverse_index(reverse_dict.getlist(lookup_view))
+            # Views that can't be reversed aren't stored, so looking up
+            # unknown names doesn't make the indexes grow.
+            if lookup_view in reverse_dict:
+                self._lang_reverse_indexes.setdefault(lang, {})[lookup_view] = index
+            return index
+
+    # The namespace and app dicts are built alongside the reverse dict, and
+    # like it they depend on the language the patterns were translated into.
+    def get_namespace_dict(self, lang=None):
+        if lang is None:
+            lang = get_language()
+        if lang not in self._lang_namespace_dicts:
+            self.get_reverse_dict(lang)
+        return self._lang_namespace_dicts[lang]
+    namespace_dict = property(get_namespace_dict)
+
+    def get_app_dict(self, lang=None):
+        if lang is None:
+            lang = get_language()
+        if lang not in self._lang_app_dicts:
+            self.get_reverse_dict(lang)
+        return self._lang_app_dicts[lang]
+    app_dict = property(get_app_dict)
+
+
+# Position of each language in settings.LANGUAGES, used to index the regexes
+# of the compact pattern classes.
+_language_positions = dict([(lang, position) for (position, lang)
+                            in enumerate(get_languages())])
+
+
+class CompactRegexMixin(object):
+    """
+    Keeps the compiled regexes of a pattern in a tuple with one item for each
+    language in settings.LANGUAGES, in the same order, instead of a dict.
+    Regexes for languages that aren't in settings.LANGUAGES go in a dict that
+    is only created when one is needed.
+    """
+    __slots__ = ()
+
+    def get_regex(self, lang=None):
+        lang = lang or get_language()
+        position = _language_positions.get(lang)
+        if position is not None:
+            regex = self._regexes[position]
+        elif self._other_regexes is not None:
+            regex = self._other_regexes.get(lang)
+        else:
+            regex = None
+        if regex is None:
+            if prepare_urlconf():
+                return self.get_regex(lang)
+            regex = compile_translated_regex(self._raw_regex, lang)
+            self.set_regex(lang, regex)
+        return regex
+    regex = property(get_regex)
+
+    def set_regex(self, lang, regex):
+        position = _language_positions.get(lang)
+        if position is not None:
+            regexes = self._regexes
+            self._regexes = regexes[:position] + (regex,) + regexes[position + 1:]
+        else:
+            if self._other_regexes is None:
+                self._other_regexes = {}
+            self._other_regexes[lang] = regex
+
+    def _get_regex_dict(self):
+        regex_dict = dict([(lang, regex) for (lang, regex)
+                           in zip(get_languages(), self._regexes) if regex is not None])
+        regex_dict.update(self._other_regexes or {})
+        return regex_dict
+    _regex_dict = property(_get_regex_dict)
+
+
+class CompactMultilangRegexURLPattern(CompactRegexMixin, MultilangRegexURLPattern):
+    """
+    MultilangRegexURLPattern that takes less memory. Its base classes don't
+    use ``__slots__``, so instances still have a ``__dict__``, but every
+    attribute set here is a slot, so it stays empty and is never allocated
+    unless something else adds an attribute.
+    """
+    __slots__ = ('_raw_regex', '_callback', '_callback_str', 'default_args',
+                 'name', '_regexes', '_other_regexes')
+
+    def __init__(self, regex, callback, default_args=None, name=None):
+        self._raw_regex = regex
+        if callable(callback):
+            self._callback = callback
+        else:
+            self._callback = None
+            self._callback_str = callback
+        self.default_args = default_args or {}
+        self.name = name
+        self._regexes = (None,) * len(_language_positions)
+        self._other_regexes = None
+
+
+class CompactMultilangRegexURLResolver(CompactRegexMixin, MultilangRegexURLResolver):
+    """
+    MultilangRegexURLResolver that takes less memory. Its base classes don't
+    use ``__slots__``, so instances still have a ``__dict__``, but every
+    attribute set here is a slot, so it stays empty and is never allocated
+    unless something else adds an attribute.
+    """
+    __slots__ = ('_raw_regex', 'urlconf_name', '_urlconf_module', 'callback',
+                 'default_kwargs', 'namespace', 'app_name', '_lang_reverse_dicts',
+                 '_lang_reverse_indexes', '_lang_namespace_dicts', '_lang_app_dicts',
+                 '_lang_resolve_indexes', '_regexes', '_other_regexes')
+
+    def __init__(self, regex, urlconf_name, default_kwargs=None, app_name=None, namespace=None):
+        self._raw_regex = regex
+        self.urlconf_name = urlconf_name
+        if not isinstance(urlconf_name, basestring):
+            self._urlconf_module = self.urlconf_name
+        self.callback = None
+        self.default_kwargs = default_kwargs or {}
+        self.namespace = namespace
+        self.app_name = app_name
+        self._lang_reverse_dicts = {}
+        self._lang_reverse_indexes = {}
+        self._lang_namespace_dicts = {}
+        self._lang_app_dicts = {}
+        self._lang_resolve_indexes = {}
+        self._regexes = (None,) * len(_language_positions)
+        self._other_regexes = None
+
 
 class LangSelectionRegexURLResolver(MultilangRegexURLResolver):
     def __init__(self, urlconf_name, default_kwargs=None, app_name=None, namespace=None):
@@ -227,15 +1085,39 @@ class LangSelectionRegexURLResolver(MultilangRegexURLResolver):
         self.namespace = namespace
         self.app_name = app_name
         self._lang_reverse_dicts = {}
-        self._namespace_dict = None
-        self._app_dict = None
+        self._lang_reverse_indexes = {}
+        self._lang_namespace_dicts = {}
+        self._lang_app_dicts = {}
         self._regex_dict = {}
+        self._lang_resolve_indexes = {}
 
     def get_regex(self, lang=None):
         lang = lang or get_language()
-        return re.compile('^%s/' % lang)
+        try:
+            return self._regex_dict[lang]
+        except KeyError:
+            instrumented = instrumentation.enabled
+            if instrumented:
+                start = time.time()
+            regex = re.compile('^%s/' % lang)
+            if instrumented:
+                instrumentation.record('regex compile', lang, time.time() - start,
+                                       regex='^%s/' % lang)
+            self._regex_dict[lang] = regex
+            return regex
     regex = property(get_regex)
 
+    def _resolve(self, path):
+        if not transurlvania.settings.DIRECT_LANGUAGE_DISPATCH:
+            return super(LangSelectionRegexURLResolver, self)._resolve(path)
+        # Check the language code at the start of the path directly instead
+        # of matching it with a regex.
+        lang = get_language()
+        lang_code, new_path = split_lang_prefix(path)
+        if lang_code != lang or new_path is None:
+            raise Resolver404, {'path' : path}
+        return self.resolve_sub_path(path, new_path, lang, {})
+
 
 class PocketURLModule(object):
     handler404 = handler404
@@ -244,3 +1126,7 @@ class PocketURLModule(object):
     def __init__(self, pattern_list):
         self.urlpatterns = pattern_list
 
+
+if transurlvania.settings.CACHE_RESOLVERS:
+    install_resolver_cache()
+
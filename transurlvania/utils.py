@@ -1,7 +1,9 @@
+from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.utils.translation import get_language
 
 from transurlvania.settings import LANGUAGE_DOMAINS
+from transurlvania.urlresolvers import reverse_many
 
 
 def complete_url(url, lang=None):
@@ -19,3 +21,56 @@ def complete_url(url, lang=None):
                 'Not domain specified for language code %s' % lang
             )
     return url
+
+
+def _get_permalink_bits(obj):
+    """
+    Returns the function ``obj``'s ``get_absolute_url`` was decorated with by
+    ``permalink_in_lang``, or None if it wasn't decorated or it's overridden
+    by settings.ABSOLUTE_URL_OVERRIDES.
+    """
+    opts = getattr(obj, '_meta', None)
+    if opts is not None and '%s.%s' % (opts.app_label, opts.module_name) in settings.ABSOLUTE_URL_OVERRIDES:
+        return None
+    return getattr(obj.get_absolute_url, 'permalink_bits', None)
+
+
+def get_absolute_urls(objects, languages=None, annotate=None):
+    """
+    Returns a list with a dict of absolute URLs by language code for each of
+    ``objects``, in the same order. ``languages`` defaults to the language
+    each object's ``get_absolute_url`` reverses its URL in.
+
+    If ``get_absolute_url`` is decorated with ``permalink_in_lang``, the URLs
+    are reversed with ``reverse_many``, so each view is only looked up once
+    for the whole list. Otherwise, or if the model's URL is overridden in
+    ABSOLUTE_URL_OVERRIDES, ``get_absolute_url`` is called once for each
+    object, and its result is the only URL given for the object, keyed by the
+    active language whatever ``languages`` is.
+
+    If ``annotate`` is given, each object's dict of URLs is also set as that
+    attribute of the object.
+    """
+    objects = list(objects)
+    # Not a dict keyed by object: unsaved model instances are all equal.
+    urls = []
+    lookups = []
+    for obj in objects:
+        obj_urls = {}
+        urls.append(obj_urls)
+        get_bits = _get_permalink_bits(obj)
+        if get_bits is None:
+            obj_urls[get_language()] = obj.get_absolute_url()
+            continue
+        bits = get_bits(obj)
+        args = len(bits) > 2 and bits[2] or ()
+        kwargs = len(bits) > 3 and bits[3] or {}
+        for lang in languages or [bits[1]]:
+            lookups.append((obj_urls, lang, (bits[0], lang, args, kwargs)))
+    results = reverse_many([lookup for (obj_urls, lang, lookup) in lookups])
+    for (obj_urls, lang, lookup), url in zip(lookups, results):
+        obj_urls[lang] = url
+    if annotate:
+        for obj, obj_urls in zip(objects, urls):
+            setattr(obj, annotate, obj_urls)
+    return urls
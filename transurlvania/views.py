@@ -1,8 +1,65 @@
-from django.http import HttpResponseRedirect
+from django.core import urlresolvers
+from django.http import HttpResponse, HttpResponseRedirect, Http404
 from django.utils.translation import get_language_from_request
 
+from transurlvania.sitemaps import iter_sitemap_xml, iter_sitemap_index_xml
+
 
 def detect_language_and_redirect(request):
     return HttpResponseRedirect(
         '/%s/' % get_language_from_request(request)
     )
+
+
+def _get_sitemap(sitemap):
+    if callable(sitemap):
+        return sitemap()
+    return sitemap
+
+
+def sitemap_index(request, sitemaps):
+    """
+    Lists every page of each of the ``sitemaps`` dict's sitemaps, which are
+    served by the ``sitemap`` view.
+    """
+    protocol = request.is_secure() and 'https' or 'http'
+    host = request.get_host()
+    sitemap_urls = []
+    for section, sitemap in sitemaps.items():
+        pages = _get_sitemap(sitemap).get_num_pages()
+        sitemap_url = '%s://%s%s' % (protocol, host, urlresolvers.reverse(
+            'transurlvania.views.sitemap', kwargs={'section': section}))
+        sitemap_urls.append(sitemap_url)
+        for page in range(2, pages + 1):
+            sitemap_urls.append('%s?p=%s' % (sitemap_url, page))
+    return HttpResponse(iter_sitemap_index_xml(sitemap_urls), mimetype='application/xml')
+
+
+def sitemap(request, sitemaps, section=None):
+    """
+    Streams the page given by the ``p`` GET parameter of the sitemap for
+    ``section``. Without a section, the only sitemap is served if it fits on
+    one page. Otherwise the sitemap index is, since a single file listing
+    every page of every sitemap could go over the limits on a sitemap's size.
+    """
+    if section is None:
+        if len(sitemaps) != 1:
+            return sitemap_index(request, sitemaps)
+        name = sitemaps.keys()[0]
+    else:
+        name = section
+    if name not in sitemaps:
+        raise Http404("No sitemap available for section: %r" % name)
+    sitemap = _get_sitemap(sitemaps[name])
+    pages = sitemap.get_num_pages()
+    if section is None and pages > 1:
+        return sitemap_index(request, sitemaps)
+    try:
+        page = int(request.GET.get('p', 1))
+    except ValueError:
+        raise Http404("No page '%s'" % request.GET['p'])
+    if page < 1 or page > pages:
+        raise Http404("Page %s empty" % page)
+    protocol = request.is_secure() and 'https' or 'http'
+    return HttpResponse(iter_sitemap_xml([sitemap], page, protocol, request.get_host()),
+                        mimetype='application/xml')
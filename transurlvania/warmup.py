@@ -0,0 +1,82 @@
+"""
+Loads everything transurlvania needs to resolve and reverse translated URLs,
+which otherwise gets loaded lazily by the first request in each language.
+
+Call ``warm_up`` from the WSGI script to do the work when the process starts:
+
+    from transurlvania.warmup import warm_up
+    warm_up()
+
+With a prefork server that loads the WSGI script before forking (such as
+gunicorn with ``--preload``), call ``preload`` instead, so the workers share
+one copy of everything.
+"""
+import time
+
+from django.conf import settings
+
+from transurlvania.urlresolvers import MultilangRegexURLResolver
+from transurlvania.urlresolvers import compile_all_languages, get_languages
+from transurlvania.urlresolvers import get_ugettext
+from transurlvania.urlresolvers import iter_url_patterns, resolver_registry
+import transurlvania.settings
+
+
+def warm_up(urlconf=None, languages=None):
+    """
+    Loads the gettext catalogs for ``languages`` (all of settings.LANGUAGES by
+    default), then builds the resolvers, compiled regexes and reverse dicts
+    for the URLconf in each of them. Returns a list of ``(stage, seconds)``
+    pairs giving the time each stage took.
+    """
+    if urlconf is None:
+        urlconf = settings.ROOT_URLCONF
+    languages = languages or get_languages()
+    timings = []
+
+    start = time.time()
+    for lang in languages:
+        get_ugettext(lang)
+    timings.append(('catalogs', time.time() - start))
+
+    start = time.time()
+    resolvers = [pattern for pattern
+                 in iter_url_patterns(MultilangRegexURLResolver(r'^/', urlconf).url_patterns)
+                 if hasattr(pattern, 'get_reverse_dict')]
+    timings.append(('resolvers', time.time() - start))
+
+    start = time.time()
+    compile_all_languages(urlconf, languages)
+    timings.append(('regexes', time.time() - start))
+
+    start = time.time()
+    resolver_registry.warm(urlconf, languages)
+    # Namespaced resolvers are left out of their parent's reverse dict, so
+    # they have to be built separately.
+    for resolver in resolvers:
+        for lang in languages:
+            resolver.get_reverse_dict(lang)
+    timings.append(('reverse dicts', time.time() - start))
+
+    if transurlvania.settings.RESOLVE_ENGINE != 'sequential':
+        start = time.time()
+        for lang in languages:
+            resolver_registry.get(urlconf, lang).get_resolve_index(lang)
+            for resolver in resolvers:
+                resolver.get_resolve_index(lang)
+        timings.append(('resolve indexes', time.time() - start))
+
+    return timings
+
+
+def preload(urlconf=None, languages=None):
+    """
+    Like ``warm_up``, but also builds everything the resolvers would fill in
+    while serving requests (see ``ResolverRegistry.preload``). Returns the
+    timings, with a final 'preload' stage.
+    """
+    timings = warm_up(urlconf, languages)
+    start = time.time()
+    resolver_registry.preload(urlconf, languages)
+    timings.append(('preload', time.time() - start))
+    return timings